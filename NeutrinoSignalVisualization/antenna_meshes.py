@@ -0,0 +1,107 @@
+"""
+Simplified 3-D meshes of the antennas for the signal direction plot, in the
+antenna frame with the orientation along z and the rotation along y. Meshes
+are (vertices, faces) pairs with vertices of shape (n, 3) and faces of shape
+(m, 3), built once when the module is imported.
+"""
+import numpy as np
+
+
+def make_cylinder(radius, z_min, z_max, n_segments=12):
+    """
+    Returns the side of a cylinder around the z axis.
+    """
+    angles = np.linspace(0, 2. * np.pi, n_segments, endpoint=False)
+    ring = np.stack((radius * np.cos(angles), radius * np.sin(angles)), axis=-1)
+    vertices = np.concatenate((
+        np.column_stack((ring, np.full(n_segments, z_min))),
+        np.column_stack((ring, np.full(n_segments, z_max)))
+    ))
+    bottom = np.arange(n_segments)
+    next_bottom = np.roll(bottom, -1)
+    faces = np.concatenate((
+        np.stack((bottom, bottom + n_segments, next_bottom), axis=-1),
+        np.stack((bottom + n_segments, next_bottom + n_segments, next_bottom), axis=-1)
+    ))
+    return vertices, faces
+
+
+def make_cone(radius, z_tip, z_base, n_segments=12):
+    """
+    Returns the side of a cone around the z axis, without its base.
+    """
+    angles = np.linspace(0, 2. * np.pi, n_segments, endpoint=False)
+    vertices = np.concatenate((
+        [[0., 0., z_tip]],
+        np.column_stack((radius * np.cos(angles), radius * np.sin(angles), np.full(n_segments, z_base)))
+    ))
+    ring = np.arange(1, n_segments + 1)
+    faces = np.stack((np.zeros(n_segments, dtype=int), ring, np.roll(ring, -1)), axis=-1)
+    return vertices, faces
+
+
+def combine_meshes(*meshes):
+    vertices = []
+    faces = []
+    n_vertices = 0
+    for mesh_vertices, mesh_faces in meshes:
+        vertices.append(mesh_vertices)
+        faces.append(mesh_faces + n_vertices)
+        n_vertices += len(mesh_vertices)
+    return np.concatenate(vertices), np.concatenate(faces)
+
+
+def make_lpda():
+    """
+    The LPDA as a flat triangle in the y-z plane, pointing along z.
+    """
+    return np.array([[0., -.25, 0.], [0., 0., .75], [0., .25, 0.]]), np.array([[0, 1, 2]])
+
+
+def make_bicone():
+    return combine_meshes(
+        make_cone(.15, 0., .45),
+        make_cone(.15, 0., -.45),
+        make_cylinder(.03, -.5, .5)
+    )
+
+
+def make_vpol():
+    """
+    The RNO-G V-pol: two cylindrical dipole halves with a feed gap.
+    """
+    return combine_meshes(
+        make_cylinder(.07, -.5, -.03),
+        make_cylinder(.07, .03, .5)
+    )
+
+
+def make_hpol():
+    """
+    The RNO-G H-pol (quad-slot): a short, wide tube with four slots along z.
+    """
+    slot_width = np.pi / 10.
+    segments = []
+    for i_slot in range(4):
+        start = i_slot * np.pi / 2. + slot_width / 2.
+        angles = np.linspace(start, start + np.pi / 2. - slot_width, 4)
+        ring = np.stack((.1 * np.cos(angles), .1 * np.sin(angles)), axis=-1)
+        vertices = np.concatenate((
+            np.column_stack((ring, np.full(len(angles), -.3))),
+            np.column_stack((ring, np.full(len(angles), .3)))
+        ))
+        bottom = np.arange(len(angles) - 1)
+        top = bottom + len(angles)
+        segments.append((vertices, np.concatenate((
+            np.stack((bottom, top, bottom + 1), axis=-1),
+            np.stack((top, top + 1, bottom + 1), axis=-1)
+        ))))
+    return combine_meshes(*segments)
+
+
+antenna_meshes = {
+    'bicone_v8_InfFirn': make_bicone(),
+    'createLPDA_100MHz_InfFirn': make_lpda(),
+    'greenland_vpol_InfFirn': make_vpol(),
+    'fourslot_InfFirn': make_hpol()
+}
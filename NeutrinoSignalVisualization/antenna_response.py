@@ -0,0 +1,158 @@
+"""
+Lookup tables of the antenna responses over the directions the zenith and
+azimuth sliders can select, so that a callback only has to slice an array.
+For long traces the tables are built with at most max_table_samples samples
+and linearly interpolated to the finer frequency binning.
+"""
+import numpy as np
+from NuRadioReco.utilities import units
+from cache import LRUCache, DiskCache
+import metrics
+
+antenna_types = [
+    'bicone_v8_InfFirn',
+    'createLPDA_100MHz_InfFirn',
+    'greenland_vpol_InfFirn',
+    'fourslot_InfFirn'
+]
+zenith_grid = np.arange(0., 180.01, 5.)
+azimuth_grid = np.arange(0., 360.01, 10.)
+antenna_orientation = (0., 0., 90. * units.deg, 0.)
+max_table_samples = 1024
+
+_antennapattern_provider = None
+response_tables = LRUCache(max_size=8)
+shared_response_tables = DiskCache('antenna_response')
+metrics.register_cache('antenna_response_tables', response_tables)
+metrics.register_cache('antenna_response_tables_disk', shared_response_tables)
+
+
+def get_antennapattern_provider():
+    global _antennapattern_provider
+    if _antennapattern_provider is None:
+        import NuRadioReco.detector.antennapattern
+        _antennapattern_provider = NuRadioReco.detector.antennapattern.AntennaPatternProvider()
+    return _antennapattern_provider
+
+
+def get_table_frequencies(samples, sampling_rate):
+    return np.fft.rfftfreq(min(samples, max_table_samples), 1. / sampling_rate)
+
+
+def build_response_table(antenna_type, table_samples, sampling_rate):
+    """
+    Evaluates the antenna response for all directions of the zenith and
+    azimuth grid, with one call vectorized over the frequencies per direction,
+    as NuRadioReco only takes a single direction per call.
+    Returns a complex array of shape (zenith, azimuth, frequency, {theta, phi}).
+    """
+    antenna_pattern = get_antennapattern_provider().load_antenna_pattern(antenna_type)
+    freqs = get_table_frequencies(table_samples, sampling_rate)
+    table = np.zeros((len(zenith_grid), len(azimuth_grid), len(freqs), 2), dtype=np.complex64)
+    with metrics.timed('antenna_table'):
+        for i_zenith, zenith in enumerate(zenith_grid):
+            for i_azimuth, azimuth in enumerate(azimuth_grid):
+                antenna_response = antenna_pattern.get_antenna_response_vectorized(
+                    freqs,
+                    zenith * units.deg,
+                    azimuth * units.deg,
+                    *antenna_orientation
+                )
+                table[i_zenith, i_azimuth, :, 0] = antenna_response['theta']
+                table[i_zenith, i_azimuth, :, 1] = antenna_response['phi']
+    table.flags.writeable = False
+    return table
+
+
+def check_response_table(antenna_type, samples=512, sampling_rate=1. * units.GHz, n_directions=20, seed=0):
+    """
+    Compares the table at random grid points, and its interpolation between
+    them, with responses computed by NuRadioReco for the same directions.
+    Returns the largest relative deviation of each.
+    """
+    antenna_pattern = get_antennapattern_provider().load_antenna_pattern(antenna_type)
+    freqs = get_table_frequencies(samples, sampling_rate)
+    table = build_response_table(antenna_type, min(samples, max_table_samples), sampling_rate)
+    random_state = np.random.RandomState(seed)
+    deviations = {'grid': 0., 'interpolated': 0.}
+    for i_direction in range(n_directions):
+        i_zenith = random_state.randint(len(zenith_grid))
+        i_azimuth = random_state.randint(len(azimuth_grid))
+        for name, zenith, azimuth, response in [
+            ('grid', zenith_grid[i_zenith], azimuth_grid[i_azimuth], table[i_zenith, i_azimuth]),
+            ('interpolated', zenith_grid[i_zenith], azimuth_grid[i_azimuth] + 1., None)
+        ]:
+            if response is None:
+                response = np.stack(get_antenna_response(antenna_type, zenith, azimuth, samples, sampling_rate), axis=-1)
+            expected = antenna_pattern.get_antenna_response_vectorized(freqs, zenith * units.deg, azimuth * units.deg, *antenna_orientation)
+            expected = np.stack((expected['theta'], expected['phi']), axis=-1)
+            deviation = np.max(np.abs(response - expected)) / max(np.max(np.abs(expected)), 1.e-30)
+            deviations[name] = max(deviations[name], float(deviation))
+    return deviations
+
+
+def get_response_table(antenna_type, samples, sampling_rate):
+    """
+    Returns the response table for the frequencies of get_table_frequencies.
+    """
+    key = (antenna_type, min(samples, max_table_samples), sampling_rate)
+    return response_tables.get_or_compute(
+        key,
+        shared_response_tables.get_or_compute,
+        key,
+        build_response_table,
+        *key
+    )
+
+
+def _interpolate_frequencies(responses, samples, sampling_rate):
+    """
+    Interpolates responses of shape (..., table frequency, {theta, phi}) to
+    the frequencies of a trace with the given number of samples.
+    """
+    if samples <= max_table_samples:
+        return responses
+    table_freqs = get_table_frequencies(samples, sampling_rate)
+    positions = np.fft.rfftfreq(samples, 1. / sampling_rate) / (table_freqs[1] - table_freqs[0])
+    indices = np.clip(np.floor(positions).astype(int), 0, len(table_freqs) - 2)
+    weights = (positions - indices).astype(np.float32)[:, None]
+    return (1. - weights) * responses[..., indices, :] + weights * responses[..., indices + 1, :]
+
+
+def get_antenna_response(antenna_type, zenith, azimuth, samples, sampling_rate):
+    """
+    Returns the theta and phi components of the antenna response for a
+    direction given in degrees, bilinearly interpolated between grid points
+    by interpolate_antenna_responses.
+    """
+    response = interpolate_antenna_responses(antenna_type, [zenith], [azimuth], samples, sampling_rate)[0]
+    return response[:, 0], response[:, 1]
+
+
+def interpolate_antenna_responses(antenna_type, zeniths, azimuths, samples, sampling_rate):
+    """
+    Vectorized version of get_antenna_response for arrays of directions given
+    in degrees. Returns a complex array of shape (direction, frequency, {theta, phi}).
+    """
+    table = get_response_table(antenna_type, samples, sampling_rate)
+    zeniths = np.clip(np.asarray(zeniths, dtype=float), zenith_grid[0], zenith_grid[-1])
+    azimuths = np.mod(np.asarray(azimuths, dtype=float), 360.)
+    i_zenith = np.clip(np.searchsorted(zenith_grid, zeniths, side='right') - 1, 0, len(zenith_grid) - 2)
+    i_azimuth = np.clip(np.searchsorted(azimuth_grid, azimuths, side='right') - 1, 0, len(azimuth_grid) - 2)
+    w_zenith = ((zeniths - zenith_grid[i_zenith]) / (zenith_grid[i_zenith + 1] - zenith_grid[i_zenith]))[:, None, None]
+    w_azimuth = ((azimuths - azimuth_grid[i_azimuth]) / (azimuth_grid[i_azimuth + 1] - azimuth_grid[i_azimuth]))[:, None, None]
+    responses = (1. - w_zenith) * (1. - w_azimuth) * table[i_zenith, i_azimuth] \
+        + (1. - w_zenith) * w_azimuth * table[i_zenith, i_azimuth + 1] \
+        + w_zenith * (1. - w_azimuth) * table[i_zenith + 1, i_azimuth] \
+        + w_zenith * w_azimuth * table[i_zenith + 1, i_azimuth + 1]
+    return _interpolate_frequencies(responses.astype(np.complex64), samples, sampling_rate)
+
+
+if __name__ == '__main__':
+    # Checks the tables against NuRadioReco: grid points have to match up to
+    # single precision, interpolated directions only roughly
+    for antenna_type in antenna_types:
+        deviations = check_response_table(antenna_type)
+        print('{:<28} grid {:.2e}  interpolated 1 deg off the grid {:.2e}'.format(antenna_type, deviations['grid'], deviations['interpolated']))
+        if deviations['grid'] > 1.e-5:
+            raise SystemExit('the response table of {} does not match NuRadioReco'.format(antenna_type))
@@ -1,9 +1,17 @@
+import startup
 import dash
 from flask import Flask, send_from_directory
 import os
+import request_coalescing
+import metrics
+import transport
 
 server = Flask(__name__, static_folder='static')
 app = dash.Dash(server=server)
+request_coalescing.init_app(server)
+startup.init_app(server)
+metrics.init_app(server)
+transport.init_app(server)
 
 
 # @server.route('/favicon.ico')
@@ -0,0 +1,232 @@
+/*
+ * Client-side callbacks that build the figures from the arrays sent by the
+ * server, which arrive as base64-encoded float32 buffers (see transport.py).
+ * Polarization weighting and unit conversion happen here, so moving the
+ * polarization slider does not need a request to the server.
+ */
+(function() {
+    // Both return plain arrays, also for Float32Array inputs, so that the
+    // figures stay JSON-serializable.
+    function scale(values, factor) {
+        return Array.prototype.map.call(values, function(value) { return value * factor; });
+    }
+
+    function combine(first, second, firstFactor, secondFactor) {
+        return Array.prototype.map.call(first, function(value, i) { return firstFactor * value + secondFactor * second[i]; });
+    }
+
+    function makeTwoPanelLayout(titles, xTitles, yTitles, sharedY) {
+        var layout = {
+            xaxis: {domain: [0, .45], anchor: 'y', title: {text: xTitles[0]}},
+            yaxis: {anchor: 'x', title: {text: yTitles[0]}},
+            xaxis2: {domain: [.55, 1], anchor: 'y2', title: {text: xTitles[1]}},
+            yaxis2: {anchor: 'x2', title: {text: yTitles[1]}},
+            annotations: titles.map(function(title, i) {
+                return {
+                    text: title,
+                    x: i === 0 ? .225 : .775,
+                    y: 1,
+                    xref: 'paper',
+                    yref: 'paper',
+                    xanchor: 'center',
+                    yanchor: 'bottom',
+                    showarrow: false,
+                    font: {size: 16}
+                };
+            })
+        };
+        if (sharedY) {
+            layout.yaxis2.matches = 'y';
+            layout.yaxis2.showticklabels = false;
+        }
+        return layout;
+    }
+
+    function makeTrace(x, y, name, panel, line) {
+        var trace = {
+            type: 'scatter',
+            x: x,
+            y: y,
+            name: name,
+            xaxis: panel === 1 ? 'x' : 'x2',
+            yaxis: panel === 1 ? 'y' : 'y2'
+        };
+        if (line) {
+            trace.line = line;
+        }
+        return trace;
+    }
+
+    // Decodes the arrays encoded by transport.encode_array into Float32Arrays,
+    // split into rows for two-dimensional arrays.
+    function decodeArray(encoded) {
+        var bytes = atob(encoded.__ndarray__);
+        var buffer = new Uint8Array(bytes.length);
+        for (var i = 0; i < bytes.length; i++) {
+            buffer[i] = bytes.charCodeAt(i);
+        }
+        var values = new Float32Array(buffer.buffer);
+        if (encoded.shape.length < 2) {
+            return values;
+        }
+        var rowLength = encoded.shape[1];
+        var rows = [];
+        for (var row = 0; row < encoded.shape[0]; row++) {
+            rows.push(values.subarray(row * rowLength, (row + 1) * rowLength));
+        }
+        return rows;
+    }
+
+    function parse(data) {
+        if (!data) {
+            return null;
+        }
+        return JSON.parse(data, function(key, value) {
+            if (value !== null && typeof value === 'object' && value.__ndarray__ !== undefined) {
+                return decodeArray(value);
+            }
+            return value;
+        });
+    }
+
+    // The base figure of the signal direction plot is parsed once per antenna
+    // type, not on every step of a slider drag.
+    var directionBase = {json: null, figure: null};
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        signal_chain: {
+            electric_field_figure: function(data, polarizationAngle) {
+                data = parse(data);
+                if (data === null) {
+                    return {};
+                }
+                var angle = polarizationAngle * Math.PI / 180;
+                var traces = [];
+                data.models.forEach(function(modelData) {
+                    var suffix = data.models.length > 1 ? ' ' + modelData.model : '';
+                    var times = scale(modelData.times, 1 / modelData.units.time);
+                    var freqs = scale(modelData.freqs, 1 / modelData.units.frequency);
+                    var trace = scale(modelData.trace, 1 / modelData.units.trace);
+                    var spectrum = scale(modelData.spectrum, 1 / modelData.units.spectrum);
+                    traces.push(
+                        makeTrace(times, scale(trace, Math.cos(angle)), 'E_theta (t)' + suffix, 1),
+                        makeTrace(times, scale(trace, Math.sin(angle)), 'E_phi (t)' + suffix, 1),
+                        makeTrace(freqs, scale(spectrum, Math.abs(Math.cos(angle))), 'E_theta (f)' + suffix, 2),
+                        makeTrace(freqs, scale(spectrum, Math.abs(Math.sin(angle))), 'E_phi (f)' + suffix, 2)
+                    );
+                });
+                return {
+                    data: traces,
+                    layout: makeTwoPanelLayout(['Time Trace', 'Spectrum'], ['t [ns]', 'f [MHz]'], ['E[mV/m]', 'E [mV/m/GHz]'], false)
+                };
+            },
+
+            voltage_figure: function(data, polarizationAngle) {
+                data = parse(data);
+                if (data === null) {
+                    return {};
+                }
+                var angle = polarizationAngle * Math.PI / 180;
+                var cos = Math.cos(angle);
+                var sin = Math.sin(angle);
+                var traces = [];
+                data.models.forEach(function(modelData) {
+                    var suffix = data.models.length > 1 ? ' ' + modelData.model : '';
+                    var times = scale(modelData.times, 1 / modelData.units.time);
+                    var freqs = scale(modelData.freqs, 1 / modelData.units.frequency);
+                    var trace = scale(combine(modelData.traces[0], modelData.traces[1], cos, sin), 1 / modelData.units.trace);
+                    var real = combine(modelData.spectra_real[0], modelData.spectra_real[1], cos, sin);
+                    var imag = combine(modelData.spectra_imag[0], modelData.spectra_imag[1], cos, sin);
+                    var spectrum = real.map(function(value, i) {
+                        return Math.sqrt(value * value + imag[i] * imag[i]) / modelData.units.spectrum;
+                    });
+                    if (modelData.noise !== null) {
+                        traces.push(makeTrace(times, combine(trace, modelData.noise, 1, 1 / modelData.units.trace), 'U + noise (t)' + suffix, 1, {width: 1}));
+                    }
+                    traces.push(makeTrace(times, trace, 'U (t)' + suffix, 1));
+                    traces.push(makeTrace(freqs, spectrum, 'U (f)' + suffix, 2));
+                });
+                return {
+                    data: traces,
+                    layout: makeTwoPanelLayout(['Time Trace', 'Spectrum'], ['t [ns]', 'f [MHz]'], ['U [mV]', 'U [mV/GHz]'], false)
+                };
+            },
+
+            detector_response_figure: function(data) {
+                data = parse(data);
+                if (data === null) {
+                    return {};
+                }
+                var freqs = scale(data.freqs, 1 / data.units.frequency);
+                return {
+                    data: [
+                        makeTrace(freqs, scale(data.theta, 1), 'Theta', 1),
+                        makeTrace(freqs, scale(data.phi, 1), 'Phi', 2)
+                    ],
+                    layout: makeTwoPanelLayout(['Theta', 'Phi'], ['f [MHz]', 'f [MHz]'], ['VEL', 'VEL'], true)
+                };
+            },
+
+            signal_direction_figure: function(zenith, azimuth, base) {
+                if (base !== directionBase.json) {
+                    directionBase = {json: base, figure: parse(base)};
+                }
+                if (directionBase.figure === null) {
+                    return {};
+                }
+                zenith = zenith * Math.PI / 180;
+                azimuth = azimuth * Math.PI / 180;
+                var direction = Object.assign({}, directionBase.figure.data[0], {
+                    x: [0, Math.sin(zenith) * Math.cos(azimuth)],
+                    y: [0, Math.sin(zenith) * Math.sin(azimuth)],
+                    z: [0, Math.cos(zenith)]
+                });
+                return {
+                    data: [direction].concat(directionBase.figure.data.slice(1)),
+                    layout: directionBase.figure.layout
+                };
+            },
+
+            // Links to the snapshot export of export.py for the electric field
+            // that is shown, i.e. the first model in the storage, so that
+            // exporting never computes a model that is still running in the
+            // background.
+            snapshot_links: function(storedEfield, polarizationAngle, antennaType, zenith, azimuth, amplifierType,
+                    filterToggle, filterBand, compress) {
+                var efield = JSON.parse(storedEfield);
+                if (efield === null) {
+                    return ['', '', 'Download npz', 'Download HDF5'];
+                }
+                var efieldParameters = efield.parameters;
+                var model = efieldParameters[3];
+                var parameters = {
+                    log_energy: efieldParameters[0],
+                    viewing_angle: efieldParameters[1],
+                    shower_type: efieldParameters[2],
+                    model: model,
+                    propagation_length: efieldParameters[4],
+                    attenuation_model: efieldParameters[5],
+                    depth: efieldParameters[6],
+                    path_zenith: efieldParameters[7],
+                    polarization_angle: polarizationAngle,
+                    antenna_type: antennaType,
+                    zenith: zenith,
+                    azimuth: azimuth,
+                    amplifier_type: amplifierType,
+                    filter_band: filterToggle.indexOf('filter') >= 0 ? filterBand : null,
+                    samples: efieldParameters[8],
+                    // The electric field stores it in the internal units, which are GHz
+                    sampling_rate: efieldParameters[9]
+                };
+                var query = '&compress=' + (compress.indexOf('compress') >= 0 ? '1' : '0') +
+                    '&parameters=' + encodeURIComponent(JSON.stringify(parameters));
+                return [
+                    '/export/snapshot?format=npz' + query,
+                    '/export/snapshot?format=hdf5' + query,
+                    'Download npz (' + model + ')',
+                    'Download HDF5 (' + model + ')'
+                ];
+            }
+        }
+    });
+})();
@@ -0,0 +1,146 @@
+"""
+Background computation of the emission spectra of the slow shower models in a
+process pool, so that they hold neither a request thread nor the interpreter
+of the server. The electric field plot shows a preview with a fast model
+while a job runs and polls until the job has finished. The models do not
+report their progress, so it is estimated from the duration of earlier jobs
+of the same model. Sweeps wait for the jobs of all their slow spectra at
+once, while fast models are computed in the request's own process.
+"""
+import threading
+import time
+from cache import LRUCache
+import emission
+import signal_chain
+import metrics
+import process_pool
+
+slow_models = ['ARZ2019', 'ARZ2020']
+preview_model = 'Alvarez2009'
+# Assumed duration of a job of a model before one has finished, in seconds
+default_duration = 10.
+# Weight of the latest job in the average duration per model
+duration_weight = .3
+# Interval in which a request waiting for jobs checks whether it has been superseded, in seconds
+cancel_check_interval = .25
+# Time after which a failed job is started again when it is submitted, in seconds
+failed_retry_interval = 30.
+
+
+class Job(object):
+    def __init__(self, model, future):
+        self.model = model
+        self.future = future
+        self.started = time.time()
+        self.finished = threading.Event()
+        self.finished_at = None
+        self.error = None
+
+    def is_current(self):
+        """
+        Returns whether the job is running, or has failed less than
+        failed_retry_interval ago, so that it is not started again.
+        """
+        if not self.finished.is_set():
+            return True
+        return self.error is not None and time.time() - self.finished_at < failed_retry_interval
+
+
+class BackgroundJobs(object):
+    def __init__(self):
+        self._jobs = LRUCache(max_size=256)
+        self._durations = {}
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+
+    def submit(self, emission_parameters):
+        """
+        Starts computing the emission spectrum for the parameters of
+        signal_chain.get_emission_spectrum, unless a job for them is running
+        already, and returns the job. Failed jobs are retried once
+        failed_retry_interval has passed, finished ones if their spectrum has
+        been evicted from the cache since.
+        """
+        with self._lock:
+            job = self._jobs.get(emission_parameters)
+            if job is not None and job.is_current():
+                return job
+            model = emission_parameters[3]
+            future = process_pool.get_executor().submit(
+                emission.compute_shower_spectrum_in_worker,
+                *signal_chain.get_emission_arguments(*emission_parameters),
+                emission.supports_same_shower(model)
+            )
+            job = Job(model, future)
+            self._jobs.put(emission_parameters, job)
+        future.add_done_callback(lambda future: self._finish(emission_parameters, job))
+        return job
+
+    def _finish(self, emission_parameters, job):
+        """
+        Puts the spectrum of a finished job into the emission cache, so that
+        the request polling for it finds it there.
+        """
+        try:
+            spectrum, same_shower = job.future.result()
+        except Exception as e:
+            job.error = repr(e)
+            with self._lock:
+                self.failed += 1
+        else:
+            emission.same_shower_support[job.model] = same_shower
+            signal_chain.get_emission_spectrum.cache.put(emission_parameters, signal_chain._freeze_single(spectrum))
+            duration = time.time() - job.started
+            with self._lock:
+                self.completed += 1
+                previous = self._durations.get(job.model, duration)
+                self._durations[job.model] = (1. - duration_weight) * previous + duration_weight * duration
+            metrics.stage_latency.observe('background_emission', duration)
+        job.finished_at = time.time()
+        job.finished.set()
+
+    def get_progress(self, job):
+        """
+        Returns the estimated fraction of the job that is done, which stays
+        below 1 until the job has finished.
+        """
+        if job.finished.is_set():
+            return 1.
+        expected = self._durations.get(job.model, default_duration)
+        return min((time.time() - job.started) / expected, .99)
+
+
+def is_emission_cached(emission_parameters):
+    if emission_parameters in signal_chain.get_emission_spectrum.cache:
+        return True
+    return emission.is_cached(*signal_chain.get_emission_arguments(*emission_parameters))
+
+
+def needs_background_job(emission_parameters):
+    """
+    Returns whether the emission spectrum is of a slow model and has to be
+    computed.
+    """
+    return emission_parameters[3] in slow_models and not is_emission_cached(emission_parameters)
+
+
+def compute_concurrently(emission_parameter_sets):
+    """
+    Computes the spectra of slow models that are not cached at the same time
+    in the background pool and waits for them until the request is
+    superseded. Spectra of the fast models are left to the caller, which
+    computes them in less time than a worker process needs to start. Returns
+    the jobs that have failed.
+    """
+    from request_coalescing import coalescer
+    submitted = [jobs.submit(parameters) for parameters in emission_parameter_sets if needs_background_job(parameters)]
+    for job in submitted:
+        while not job.finished.wait(cancel_check_interval):
+            coalescer.check_cancelled()
+    return [job for job in submitted if job.error is not None]
+
+
+jobs = BackgroundJobs()
+metrics.register_counter('nsv_background_jobs_completed_total', 'Background emission jobs that have finished.', lambda: jobs.completed)
+metrics.register_counter('nsv_background_jobs_failed_total', 'Background emission jobs that have failed.', lambda: jobs.failed)
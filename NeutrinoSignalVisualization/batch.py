@@ -0,0 +1,235 @@
+"""
+Headless batch simulation with the signal chain of the app, for example to
+generate reference traces without a browser:
+
+    python batch.py parameters.json --output traces --format hdf5
+
+The parameter file holds a JSON object that maps parameter names (see
+default_parameters) to lists of values. Lists are combined element by element,
+with single values broadcast, or as a cartesian product if --product is given.
+The trace length (samples) and sampling rate (in GHz) have to be the same for
+all traces of a batch.
+"""
+import argparse
+import collections
+import itertools
+import json
+import numpy as np
+from NuRadioReco.utilities import units, fft
+import signal_chain
+import detector_response
+import process_pool
+
+default_parameters = {
+    'log_energy': 18.,
+    'viewing_angle': 2.,
+    'shower_type': 'HAD',
+    'model': 'ARZ2020',
+    'propagation_length': 0.,
+    'attenuation_model': 'GL1',
+    'depth': 200.,
+    'path_zenith': None,
+    'polarization_angle': 0.,
+    'antenna_type': 'bicone_v8_InfFirn',
+    'zenith': 90.,
+    'azimuth': 180.,
+    'amplifier_type': None,
+    'filter_band': None,
+    'samples': signal_chain.default_samples,
+    'sampling_rate': signal_chain.default_sampling_rate
+}
+
+
+def make_parameter_sets(parameters, product=False, max_sets=None):
+    """
+    Turns a dict of parameter values or lists of values into a dict of
+    equally long lists, filling in the defaults for missing parameters.
+    Raises a ValueError if there would be more than max_sets parameter sets.
+    """
+    parameters = dict(default_parameters, **parameters)
+    names = list(parameters.keys())
+    values = []
+    for name in names:
+        value = parameters[name]
+        if name == 'filter_band':
+            is_list = isinstance(value, (list, tuple)) and len(value) > 0 and (value[0] is None or isinstance(value[0], (list, tuple)))
+        else:
+            is_list = isinstance(value, (list, tuple, np.ndarray))
+        values.append(list(value) if is_list else [value])
+    if product:
+        n_sets = 1
+        for value in values:
+            n_sets *= len(value)
+    else:
+        n_sets = max(len(value) for value in values)
+        for name, value in zip(names, values):
+            if len(value) not in (1, n_sets):
+                raise ValueError('Parameter {} has {} values, expected 1 or {}'.format(name, len(value), n_sets))
+    if max_sets is not None and n_sets > max_sets:
+        raise ValueError('{} parameter sets requested, at most {} are allowed'.format(n_sets, max_sets))
+    if product:
+        combinations = list(itertools.product(*values))
+    else:
+        combinations = list(zip(*[value * n_sets if len(value) == 1 else value for value in values]))
+    parameter_sets = {name: [combination[i_name] for combination in combinations] for i_name, name in enumerate(names)}
+    parameter_sets['filter_band'] = [None if band is None else tuple(band) for band in parameter_sets['filter_band']]
+    return parameter_sets
+
+
+def _stack_unique(keys, function):
+    unique_results = {key: function(*key) for key in set(keys)}
+    return [unique_results[key] for key in keys]
+
+
+def simulate_batch(parameter_sets):
+    """
+    Runs the signal chain for a dict of equally long parameter lists, as
+    returned by make_parameter_sets, and returns the electric fields and
+    voltages stacked along the first axis.
+    """
+    if len(set(parameter_sets['samples'])) > 1 or len(set(parameter_sets['sampling_rate'])) > 1:
+        raise ValueError('All traces of a batch need the same samples and sampling_rate')
+    samples = int(parameter_sets['samples'][0])
+    sampling_rate = float(parameter_sets['sampling_rate'][0])
+    emission_spectra = np.array(_stack_unique(
+        list(zip(parameter_sets['log_energy'], parameter_sets['viewing_angle'], parameter_sets['shower_type'], parameter_sets['model'])),
+        lambda *parameters: signal_chain.get_emission_spectrum(*parameters, samples, sampling_rate)
+    ))
+
+    def get_attenuation_factor(attenuation_model, propagation_length, depth, path_zenith):
+        if propagation_length <= 0:
+            return np.ones(samples // 2 + 1, dtype=np.float32)
+        return signal_chain.get_attenuation_factor(attenuation_model, propagation_length, depth, path_zenith, samples, sampling_rate)
+
+    attenuation_factors = np.array(_stack_unique(
+        list(zip(
+            parameter_sets['attenuation_model'],
+            parameter_sets['propagation_length'],
+            parameter_sets['depth'],
+            parameter_sets['path_zenith']
+        )),
+        get_attenuation_factor
+    ))
+    efield_spectra = emission_spectra * attenuation_factors
+    polarization_angles = np.array(parameter_sets['polarization_angle'], dtype=np.float32)[:, None] * units.deg
+    efield_spectra_theta = efield_spectra * np.cos(polarization_angles)
+    efield_spectra_phi = efield_spectra * np.sin(polarization_angles)
+
+    antenna_responses = np.array(_stack_unique(
+        list(zip(parameter_sets['antenna_type'], parameter_sets['zenith'], parameter_sets['azimuth'])),
+        lambda *parameters: signal_chain.get_antenna_response(*parameters, samples, sampling_rate)
+    ))
+    chain_responses = np.array(_stack_unique(
+        list(zip(parameter_sets['amplifier_type'], parameter_sets['filter_band'])),
+        lambda amplifier_type, filter_band: detector_response.get_detector_chain_response(
+            amplifier_type,
+            filter_band,
+            samples,
+            sampling_rate
+        )
+    ))
+    voltage_spectra = (antenna_responses[:, 0] * efield_spectra_theta + antenna_responses[:, 1] * efield_spectra_phi) * chain_responses
+    efield_traces = fft.freq2time(efield_spectra, sampling_rate).astype(np.float32)
+    voltage_traces = fft.freq2time(voltage_spectra, sampling_rate).astype(np.float32)
+    return {
+        'times': np.array(signal_chain.get_times(samples, sampling_rate)),
+        'freqs': np.array(signal_chain.get_frequencies(samples, sampling_rate)),
+        'efield_trace_theta': efield_traces * np.cos(polarization_angles),
+        'efield_trace_phi': efield_traces * np.sin(polarization_angles),
+        'efield_spectrum_theta': efield_spectra_theta,
+        'efield_spectrum_phi': efield_spectra_phi,
+        'voltage_trace': voltage_traces,
+        'voltage_spectrum': voltage_spectra
+    }
+
+
+def iterate_chunks(parameter_sets, chunk_size, workers=1):
+    """
+    Yields the chunks of parameter sets with their results, in order. With
+    more than one worker, up to that many chunks are simulated at a time in
+    the process pool of process_pool.
+    """
+    n_sets = len(parameter_sets['log_energy'])
+    chunks = [
+        (i_start, {name: values[i_start:i_start + chunk_size] for name, values in parameter_sets.items()})
+        for i_start in range(0, n_sets, chunk_size)
+    ]
+    if workers <= 1 or len(chunks) <= 1:
+        for i_start, chunk in chunks:
+            yield i_start, chunk, simulate_batch(chunk)
+        return
+    executor = process_pool.get_executor()
+    pending = collections.deque()
+    try:
+        for i_start, chunk in chunks:
+            pending.append((i_start, chunk, executor.submit(simulate_batch, chunk)))
+            if len(pending) >= workers:
+                i_start, chunk, future = pending.popleft()
+                yield i_start, chunk, future.result()
+        while pending:
+            i_start, chunk, future = pending.popleft()
+            yield i_start, chunk, future.result()
+    finally:
+        # Chunks of an abandoned iteration, e.g. a closed download, are not simulated
+        for i_start, chunk, future in pending:
+            future.cancel()
+
+
+def _encode_parameters(values):
+    return np.array([json.dumps(value) for value in values])
+
+
+def add_parameters(results, chunk):
+    """
+    Adds the parameters of a chunk to its results as JSON-encoded strings.
+    """
+    for name, values in chunk.items():
+        results['parameter_' + name] = _encode_parameters(values)
+    return results
+
+
+def write_npz(parameter_sets, output, chunk_size, workers=1):
+    for i_start, chunk, results in iterate_chunks(parameter_sets, chunk_size, workers):
+        filename = '{}_{:06d}.npz'.format(output, i_start // chunk_size)
+        np.savez_compressed(filename, **add_parameters(results, chunk))
+        print('wrote {}'.format(filename))
+
+
+def write_hdf5(parameter_sets, output, chunk_size, workers=1):
+    import h5py
+    with h5py.File(output + '.hdf5', 'w') as f:
+        for i_start, chunk, results in iterate_chunks(parameter_sets, chunk_size, workers):
+            if i_start == 0:
+                f.create_dataset('times', data=results.pop('times'))
+                f.create_dataset('freqs', data=results.pop('freqs'))
+                for name, values in results.items():
+                    f.create_dataset(name, data=values, maxshape=(None,) + values.shape[1:], chunks=True, compression='gzip')
+                for name, values in chunk.items():
+                    f.create_dataset('parameters/' + name, data=_encode_parameters(values).astype(object), dtype=h5py.string_dtype(), maxshape=(None,), chunks=True)
+            else:
+                results.pop('times')
+                results.pop('freqs')
+                datasets = [(name, values) for name, values in results.items()]
+                datasets += [('parameters/' + name, _encode_parameters(values).astype(object)) for name, values in chunk.items()]
+                for name, values in datasets:
+                    f[name].resize(i_start + len(values), axis=0)
+                    f[name][i_start:] = values
+            print('{} traces written'.format(i_start + len(chunk['log_energy'])))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Simulate electric fields and voltage traces without the web interface.')
+    parser.add_argument('parameters', help='JSON file mapping parameter names to values or lists of values')
+    parser.add_argument('--output', default='traces', help='output file name, without extension')
+    parser.add_argument('--format', choices=['npz', 'hdf5'], default='npz')
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--product', action='store_true', help='simulate all combinations of the parameter lists')
+    parser.add_argument('--workers', type=int, default=1, help='number of processes simulating chunks in parallel')
+    args = parser.parse_args()
+    process_pool.max_workers = max(args.workers, 1)
+    with open(args.parameters, 'r') as f:
+        parameter_sets = make_parameter_sets(json.load(f), args.product)
+    if args.format == 'npz':
+        write_npz(parameter_sets, args.output, args.chunk_size, args.workers)
+    else:
+        write_hdf5(parameter_sets, args.output, args.chunk_size, args.workers)
@@ -0,0 +1,229 @@
+"""
+Benchmark of the server-side callbacks, run directly without a browser:
+
+    python benchmark.py --output benchmark.json --stub-askaryan
+    python benchmark.py --output new.json --compare benchmark.json
+
+For every callback and model or antenna type it reports the latency
+percentiles, the peak Python memory and the size of the serialized response,
+once with all in-process caches cleared before each call (cold) and once with
+the parameter grid already computed (warm). A cold call also recomputes
+upstream results, e.g. the electric field of a voltage call. The disk cache
+and the precomputed spectrum grid are disabled unless requested.
+
+Slow models are computed in the callback instead of a background job, so
+that their latency is measured rather than that of the preview.
+
+The signal direction plot only has its antenna part computed on the server
+(the direction is drawn client-side), so update_signal_direction_base is
+measured for it.
+"""
+import argparse
+import gzip
+import itertools
+import json
+import os
+import platform
+import time
+import tracemalloc
+import numpy as np
+from NuRadioReco.utilities import units
+
+
+def stub_frequency_spectrum(energy, viewing_angle, samples, dt, shower_type, ior, distance, model, same_shower=False):
+    """
+    Fast stand-in for the Askaryan models: a spectrum rising with frequency,
+    with a cutoff that falls away from the Cherenkov angle. Only meant for
+    timing the rest of the signal chain.
+    """
+    freqs = np.fft.rfftfreq(samples, dt)
+    off_cone_angle = np.abs(viewing_angle - np.arccos(1. / ior)) / units.deg
+    cutoff = 1. * units.GHz / (1. + off_cone_angle)
+    amplitude = 1.e-6 * energy / 1.e18 * units.km / distance * units.V / units.m / units.MHz
+    phase = np.exp(-1.j * np.pi * freqs * samples * dt)
+    return amplitude * freqs / units.GHz * np.exp(-(freqs / cutoff) ** 2) * phase
+
+
+def get_electric_field_arguments(model):
+    for log_energy, viewing_angle, propagation_length in itertools.product([17., 18., 19.], [-5., 0., 2., 5.], [0., 1.5]):
+        yield [log_energy, viewing_angle, 'HAD', [model], propagation_length, 'GL1', 200, [], 90, 512, 1., None, json.dumps(None), None]
+
+
+def get_voltage_arguments(antenna_type, electric_field):
+    for zenith, azimuth, amplifier_type, filter_toggle in itertools.product([45, 90, 135], [0, 180], [None, 'iglu'], [[], ['filter']]):
+        yield [electric_field, antenna_type, zenith, azimuth, amplifier_type, filter_toggle, [.1, .3], []]
+
+
+def _percentile(values, percentile):
+    return float(np.percentile(values, percentile))
+
+
+def _get_response_sizes(response):
+    import plotly.utils
+    serialized = json.dumps(response, cls=plotly.utils.PlotlyJSONEncoder).encode('utf-8')
+    return len(serialized), len(gzip.compress(serialized))
+
+
+class Benchmark(object):
+    def __init__(self, server, repeat, cold_repeat):
+        self.server = server
+        self.repeat = repeat
+        self.cold_repeat = cold_repeat
+        self.results = []
+
+    def call(self, function, arguments, triggered):
+        """
+        Calls the undecorated callback in a request context, as Dash would.
+        """
+        import flask
+        function = getattr(function, '__wrapped__', function)
+        with self.server.test_request_context('/_dash-update-component', method='POST'):
+            flask.g.triggered_inputs = [{'prop_id': triggered, 'value': None}]
+            return function(*arguments)
+
+    def measure(self, callback, group, function, argument_sets, triggered, clear_caches):
+        for cache_state in ['cold', 'warm']:
+            if cache_state == 'cold':
+                calls = argument_sets[:self.cold_repeat]
+            else:
+                for arguments in argument_sets:
+                    self.call(function, arguments, triggered)
+                calls = argument_sets * self.repeat
+            latencies = []
+            for arguments in calls:
+                if cache_state == 'cold':
+                    clear_caches()
+                start = time.perf_counter()
+                response = self.call(function, arguments, triggered)
+                latencies.append(time.perf_counter() - start)
+            if cache_state == 'cold':
+                clear_caches()
+            tracemalloc.start()
+            self.call(function, calls[-1], triggered)
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            response_bytes, response_gzip_bytes = _get_response_sizes(response)
+            result = {
+                'callback': callback,
+                'group': group,
+                'cache': cache_state,
+                'calls': len(latencies),
+                'latency_p50': _percentile(latencies, 50),
+                'latency_p95': _percentile(latencies, 95),
+                'latency_p99': _percentile(latencies, 99),
+                'peak_memory_bytes': peak_memory,
+                'response_bytes': response_bytes,
+                'response_gzip_bytes': response_gzip_bytes
+            }
+            self.results.append(result)
+            print('{callback:<32} {group:<28} {cache:<5} p50 {latency_p50:8.4f}s  p95 {latency_p95:8.4f}s  '
+                  'p99 {latency_p99:8.4f}s  {peak_memory_bytes:>11d} B peak  {response_bytes:>9d} B'.format(**result))
+
+
+def clear_caches():
+    """
+    Clears the in-process caches registered in metrics, including the result
+    store. The disk cache has no clear and is disabled instead.
+    """
+    import metrics
+    for cache in metrics.caches.values():
+        if hasattr(cache, 'clear'):
+            cache.clear()
+
+
+def run_benchmark(repeat, cold_repeat, stub_askaryan):
+    # The app is imported here, after the environment has been set up.
+    import emission
+    if stub_askaryan:
+        emission._compute_frequency_spectrum = stub_frequency_spectrum
+    import index
+    import background_jobs
+    import voltage_trace
+    import antenna_response
+    import spectrum_grid
+    from app import server
+    # Measure the slow models themselves rather than their previews
+    background_jobs.slow_models = []
+
+    benchmark = Benchmark(server, repeat, cold_repeat)
+    for model in spectrum_grid.models:
+        benchmark.measure(
+            'update_electric_field_plot',
+            model,
+            index.update_electric_field_plot,
+            list(get_electric_field_arguments(model)),
+            'energy-slider.value',
+            clear_caches
+        )
+    reference_arguments = next(get_electric_field_arguments(spectrum_grid.models[0]))
+    electric_field = benchmark.call(index.update_electric_field_plot, reference_arguments, 'energy-slider.value')[1]
+    for antenna_type in antenna_response.antenna_types:
+        benchmark.measure(
+            'update_voltage_plot',
+            antenna_type,
+            voltage_trace.update_voltage_plot,
+            list(get_voltage_arguments(antenna_type, electric_field)),
+            'signal-zenith-slider.value',
+            clear_caches
+        )
+        benchmark.measure(
+            'update_signal_direction_base',
+            antenna_type,
+            voltage_trace.update_signal_direction_base,
+            [[antenna_type]],
+            'antenna-type-radio-items.value',
+            clear_caches
+        )
+    return benchmark.results
+
+
+def compare(results, previous_results):
+    """
+    Prints the relative change of latency and response size for every
+    measurement that is in both result sets.
+    """
+    previous = {(result['callback'], result['group'], result['cache']): result for result in previous_results}
+    for result in results:
+        key = (result['callback'], result['group'], result['cache'])
+        if key not in previous:
+            continue
+        changes = []
+        for name in ['latency_p50', 'latency_p95', 'peak_memory_bytes', 'response_bytes']:
+            if previous[key][name] > 0:
+                changes.append('{} {:+.1%}'.format(name, result[name] / previous[key][name] - 1.))
+        print('{:<32} {:<28} {:<5} {}'.format(key[0], key[1], key[2], '  '.join(changes)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the latency, memory and payload size of the callbacks.')
+    parser.add_argument('--output', default='benchmark.json', help='JSON file to write the results to')
+    parser.add_argument('--repeat', type=int, default=5, help='passes over the parameter grid with warm caches')
+    parser.add_argument('--cold-repeat', type=int, default=3, help='calls per callback and group with cold caches')
+    parser.add_argument('--stub-askaryan', action='store_true', help='replace the Askaryan models by a fast analytic spectrum')
+    parser.add_argument('--disk-cache', action='store_true', help='keep the disk cache enabled')
+    parser.add_argument('--spectrum-grid', action='store_true', help='use the precomputed spectrum grid')
+    parser.add_argument('--compare', help='results of an earlier run to compare with')
+    args = parser.parse_args()
+    if not args.disk_cache:
+        os.environ['NSV_DISABLE_DISK_CACHE'] = '1'
+    if not args.spectrum_grid:
+        os.environ['SPECTRUM_GRID_FILE'] = os.devnull
+    results = run_benchmark(args.repeat, args.cold_repeat, args.stub_askaryan)
+    with open(args.output, 'w') as f:
+        json.dump({
+            'metadata': {
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'repeat': args.repeat,
+                'cold_repeat': args.cold_repeat,
+                'stub_askaryan': args.stub_askaryan,
+                'disk_cache': args.disk_cache,
+                'spectrum_grid': args.spectrum_grid
+            },
+            'results': results
+        }, f, indent=1)
+    print('wrote {}'.format(args.output))
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            compare(results, json.load(f)['results'])
@@ -0,0 +1,267 @@
+import collections
+import functools
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+import numpy as np
+
+
+def get_nbytes(value):
+    """
+    Returns the memory held by the numpy arrays in a value, which may be an
+    array or a tuple, list or dict of them.
+    """
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(get_nbytes(item) for item in value)
+    if isinstance(value, dict):
+        return sum(get_nbytes(item) for item in value.values())
+    return 0
+
+
+class LRUCache(object):
+    """
+    Bounded least-recently-used cache that counts hits and misses. It holds
+    at most max_size entries and, if max_bytes is given, evicts entries
+    until their arrays (see get_nbytes) take at most max_bytes, keeping at
+    least the newest entry.
+    """
+    def __init__(self, max_size=128, max_bytes=None):
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+        self._nbytes = {}
+        self._total_nbytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._total_nbytes -= self._nbytes.pop(key, 0)
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if self.max_bytes is not None:
+                self._nbytes[key] = get_nbytes(value)
+                self._total_nbytes += self._nbytes[key]
+            while len(self._data) > self.max_size or (
+                    self.max_bytes is not None and self._total_nbytes > self.max_bytes and len(self._data) > 1):
+                evicted_key, evicted_value = self._data.popitem(last=False)
+                self._total_nbytes -= self._nbytes.pop(evicted_key, 0)
+
+    def get_or_compute(self, key, function, *args, **kwargs):
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = function(*args, **kwargs)
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._nbytes.clear()
+            self._total_nbytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def get_stats(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            stats = {
+                'size': len(self._data),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / requests if requests > 0 else 0.
+            }
+            if self.max_bytes is not None:
+                stats['bytes'] = self._total_nbytes
+            return stats
+
+
+def memoize(max_size=128, max_bytes=None):
+    """
+    Decorator that memoizes a function with hashable positional arguments
+    in an LRUCache, which is available as the cache attribute of the wrapper.
+    """
+    def decorator(function):
+        cache = LRUCache(max_size, max_bytes)
+
+        @functools.wraps(function)
+        def wrapper(*args):
+            return cache.get_or_compute(args, function, *args)
+        wrapper.cache = cache
+        return wrapper
+    return decorator
+
+
+# Increased whenever the layout of the cached arrays changes
+cache_format_version = 1
+cache_version_pattern = re.compile(r'^v\d+-nuradiomc.*-nuradioreco.*$')
+# Total size of the disk cache of the current version, in bytes
+max_disk_cache_bytes = int(os.environ.get('NSV_CACHE_MAX_BYTES', 2 * 2 ** 30))
+# Number of arrays written by a process between two checks of the disk cache size
+prune_interval = 64
+
+
+def get_cache_version():
+    """
+    Returns a name for the cached data of the installed NuRadioMC and
+    NuRadioReco versions, so that a library upgrade starts from an empty cache.
+    """
+    try:
+        import importlib.metadata as importlib_metadata
+    except ImportError:
+        importlib_metadata = None
+    versions = []
+    for package in ['NuRadioMC', 'NuRadioReco']:
+        try:
+            versions.append(importlib_metadata.version(package))
+        except Exception:
+            versions.append('unknown')
+    return 'v{}-nuradiomc{}-nuradioreco{}'.format(cache_format_version, *versions)
+
+
+def remove_stale_versions(directory, current_version):
+    """
+    Deletes the disk caches of other cache format or library versions.
+    """
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return
+    for name in names:
+        if name != current_version and cache_version_pattern.match(name):
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+def prune_disk_cache(directory, max_bytes):
+    """
+    Deletes the oldest arrays below directory until the others fit into
+    max_bytes. Arrays already memory-mapped from a deleted file stay readable.
+    """
+    entries = []
+    for root, directories, filenames in os.walk(directory):
+        for filename in filenames:
+            if not filename.endswith('.npy'):
+                continue
+            path = os.path.join(root, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+    total_size = sum(size for mtime, size, path in entries)
+    for mtime, size, path in sorted(entries):
+        if total_size <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total_size -= size
+
+
+class DiskCache(object):
+    """
+    Cache of numpy arrays in a local directory, shared by all worker processes
+    of the server and kept across restarts. Arrays are written atomically and
+    read back as read-only memory maps, so that workers share the pages.
+    Entries are kept per cache format and library version (see
+    get_cache_version), the caches of other versions are deleted, and the
+    oldest entries are deleted when all namespaces together exceed
+    max_disk_cache_bytes.
+    """
+    def __init__(self, namespace, directory=None):
+        if directory is None:
+            directory = os.environ.get('NSV_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'nsv-cache'))
+        self.root_directory = directory
+        self.version_directory = os.path.join(directory, get_cache_version())
+        self.directory = os.path.join(self.version_directory, namespace)
+        self.namespace = namespace
+        self.enabled = os.environ.get('NSV_DISABLE_DISK_CACHE') is None
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+
+    def _prune(self):
+        if self._puts == 0:
+            remove_stale_versions(self.root_directory, os.path.basename(self.version_directory))
+            # Layout from before the caches were versioned
+            shutil.rmtree(os.path.join(self.root_directory, self.namespace), ignore_errors=True)
+        prune_disk_cache(self.version_directory, max_disk_cache_bytes)
+
+    def _get_filename(self, key):
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.directory, digest + '.npy')
+
+    def __contains__(self, key):
+        return self.enabled and os.path.isfile(self._get_filename(key))
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        filename = self._get_filename(key)
+        try:
+            value = np.load(filename, mmap_mode='r')
+        except (IOError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        filename = self._get_filename(key)
+        file_descriptor, temporary_filename = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(file_descriptor, 'wb') as f:
+                np.save(f, value)
+            os.replace(temporary_filename, filename)
+        except OSError:
+            if os.path.exists(temporary_filename):
+                os.remove(temporary_filename)
+        with self._lock:
+            if self._puts % prune_interval == 0:
+                self._prune()
+            self._puts += 1
+
+    def get_or_compute(self, key, function, *args, **kwargs):
+        value = self.get(key)
+        if value is None:
+            value = function(*args, **kwargs)
+            self.put(key, value)
+        return value
+
+    def get_stats(self):
+        requests = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / requests if requests > 0 else 0.
+        }
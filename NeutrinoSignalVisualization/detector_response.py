@@ -0,0 +1,93 @@
+"""
+Providers for the transfer functions of the amplifiers and filters behind the
+antenna. Amplifier data files are read once, and the complex responses are
+cached per frequency binning, so a slider tick never re-reads files or
+rebuilds interpolators. NuRadioReco and scipy are only imported on first use.
+"""
+import numpy as np
+from cache import LRUCache, memoize
+import metrics
+
+amplifier_types = [None, 'iglu', 'rno_surface', '100', '200', '300']
+rno_g_amplifier_types = ['iglu', 'rno_surface']
+filter_order = 10
+
+amplifier_responses = LRUCache(max_size=32)
+filter_responses = LRUCache(max_size=64)
+chain_responses = LRUCache(max_size=128)
+metrics.register_cache('amplifier_responses', amplifier_responses)
+metrics.register_cache('filter_responses', filter_responses)
+metrics.register_cache('chain_responses', chain_responses)
+
+
+def _get_frequencies(samples, sampling_rate):
+    return np.fft.rfftfreq(samples, 1. / sampling_rate)
+
+
+@memoize(max_size=8)
+def load_amplifier(amplifier_type):
+    if amplifier_type in rno_g_amplifier_types:
+        import NuRadioReco.detector.RNO_G.analog_components
+        return NuRadioReco.detector.RNO_G.analog_components.load_amp_response(amplifier_type)
+    import NuRadioReco.detector.ARIANNA.analog_components
+    return NuRadioReco.detector.ARIANNA.analog_components.load_amplifier_response(amplifier_type)
+
+
+def _compute_amplifier_response(amplifier_type, samples, sampling_rate):
+    freqs = _get_frequencies(samples, sampling_rate)
+    if amplifier_type is None:
+        amplifier_response = np.ones_like(freqs, dtype=complex)
+    else:
+        amp_response = load_amplifier(amplifier_type)
+        if amplifier_type in rno_g_amplifier_types:
+            amplifier_response = amp_response['gain'](freqs) * np.exp(1j * amp_response['phase'](freqs))
+        else:
+            amplifier_response = amp_response['gain'](freqs) * amp_response['phase'](freqs)
+    amplifier_response.flags.writeable = False
+    return amplifier_response
+
+
+def _compute_filter_response(filter_band, samples, sampling_rate):
+    freqs = _get_frequencies(samples, sampling_rate)
+    filter_response = np.ones_like(freqs)
+    if filter_band is not None:
+        import scipy.signal
+        mask = freqs > 0
+        b, a = scipy.signal.butter(filter_order, filter_band, 'bandpass', analog=True)
+        w, h = scipy.signal.freqs(b, a, freqs[mask])
+        filter_response[mask] = np.abs(h)
+    filter_response.flags.writeable = False
+    return filter_response
+
+
+def _compute_chain_response(amplifier_type, filter_band, samples, sampling_rate):
+    chain_response = (get_amplifier_response(amplifier_type, samples, sampling_rate) * get_filter_response(filter_band, samples, sampling_rate)).astype(np.complex64)
+    chain_response.flags.writeable = False
+    return chain_response
+
+
+def get_amplifier_response(amplifier_type, samples, sampling_rate):
+    """
+    Returns the complex amplifier response, or a flat response if
+    amplifier_type is None.
+    """
+    key = (amplifier_type, samples, sampling_rate)
+    return amplifier_responses.get_or_compute(key, _compute_amplifier_response, *key)
+
+
+def get_filter_response(filter_band, samples, sampling_rate):
+    """
+    Returns the magnitude of a Butterworth bandpass for the given
+    (lower, upper) band, or a flat response if filter_band is None.
+    """
+    key = (filter_band, samples, sampling_rate)
+    return filter_responses.get_or_compute(key, _compute_filter_response, *key)
+
+
+def get_detector_chain_response(amplifier_type, filter_band, samples, sampling_rate):
+    """
+    Returns the combined transfer function of amplifier and filter, so that it
+    can be applied to a spectrum with a single multiplication.
+    """
+    key = (amplifier_type, filter_band, samples, sampling_rate)
+    return chain_responses.get_or_compute(key, _compute_chain_response, *key)
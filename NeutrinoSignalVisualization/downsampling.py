@@ -0,0 +1,40 @@
+"""
+Downsampling of traces and spectra for plotting, so that the number of points
+sent to the browser does not grow with the length of the record.
+"""
+import numpy as np
+
+max_points = 2000
+
+
+def get_downsample_indices(y, max_points=max_points):
+    """
+    Min/max decimation: splits the samples into max_points // 2 buckets and
+    returns the sorted indices of the minimum and maximum of each bucket, so
+    that narrow pulses survive the decimation.
+    """
+    n_samples = len(y)
+    if n_samples <= max_points:
+        return np.arange(n_samples)
+    bucket_size = int(np.ceil(n_samples / (max_points // 2)))
+    n_buckets = int(np.ceil(n_samples / bucket_size))
+    indices = np.minimum(np.arange(n_buckets * bucket_size), n_samples - 1).reshape((n_buckets, bucket_size))
+    buckets = np.asarray(y)[indices]
+    rows = np.arange(n_buckets)
+    return np.unique(np.concatenate((
+        indices[rows, np.argmin(buckets, axis=-1)],
+        indices[rows, np.argmax(buckets, axis=-1)]
+    )))
+
+
+def get_common_downsample_indices(ys, max_points=max_points):
+    """
+    Returns the union of the downsample indices of several lines on the same
+    x values, for lines that are combined linearly after downsampling.
+    """
+    return np.unique(np.concatenate([get_downsample_indices(y, max_points) for y in ys]))
+
+
+def downsample(x, y, max_points=max_points):
+    indices = get_downsample_indices(y, max_points)
+    return np.asarray(x)[indices], np.asarray(y)[indices]
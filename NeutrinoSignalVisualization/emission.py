@@ -0,0 +1,138 @@
+import logging
+import numpy as np
+from cache import LRUCache, DiskCache
+import spectrum_grid
+import metrics
+
+spectrum_cache = LRUCache(max_size=256)
+shared_spectrum_cache = DiskCache('spectra')
+metrics.register_cache('spectra', spectrum_cache)
+metrics.register_cache('spectra_disk', shared_spectrum_cache)
+
+logger = logging.getLogger(__name__)
+
+# Models found not to support same_shower, which are then only called without it
+same_shower_support = {}
+
+
+def supports_same_shower(model):
+    return same_shower_support.get(model, True)
+
+
+def _is_same_shower_unsupported(error):
+    """
+    Returns whether an error of the Askaryan module means that the model does
+    not take the same_shower argument, as in older versions of NuRadioMC.
+    """
+    return isinstance(error, TypeError) and 'same_shower' in str(error)
+
+
+def _is_shower_not_drawn(error):
+    """
+    Returns whether an error of the Askaryan module means that same_shower was
+    given before a shower was drawn in this process, which a call without it
+    does.
+    """
+    return isinstance(error, AttributeError) and "hasn't been called before" in str(error)
+
+
+def _make_key(energy, viewing_angle, samples, dt, shower_type, ior, distance, model, same_shower):
+    return (float(energy), float(viewing_angle), shower_type, model, int(samples), float(dt), float(ior), float(distance), same_shower)
+
+
+def get_frequency_spectrum(
+    energy,
+    viewing_angle,
+    samples,
+    dt,
+    shower_type,
+    ior,
+    distance,
+    model,
+    same_shower
+):
+    """
+    Cached version of NuRadioMC.SignalGen.askaryan.get_frequency_spectrum.
+    The returned array is shared between callers and therefore read-only.
+    """
+    key = _make_key(energy, viewing_angle, samples, dt, shower_type, ior, distance, model, same_shower)
+    spectrum = spectrum_cache.get(key)
+    if spectrum is None:
+        spectrum = shared_spectrum_cache.get_or_compute(
+            key,
+            _compute_frequency_spectrum,
+            energy,
+            viewing_angle,
+            samples,
+            dt,
+            shower_type,
+            ior,
+            distance,
+            model,
+            same_shower=same_shower
+        )
+        spectrum.flags.writeable = False
+        spectrum_cache.put(key, spectrum)
+    return spectrum
+
+
+def _compute_frequency_spectrum(*args, **kwargs):
+    import NuRadioMC.SignalGen.askaryan
+    with metrics.timed('askaryan'):
+        return NuRadioMC.SignalGen.askaryan.get_frequency_spectrum(*args, **kwargs)
+
+
+def compute_shower_spectrum(energy, viewing_angle, samples, dt, shower_type, ior, distance, model):
+    """
+    Computes the spectrum with same_shower, unless the model is known not to
+    support it. If the model rejects the argument, it is remembered as not
+    supporting it. If no shower has been drawn in this process yet, one is
+    drawn by a call without same_shower first. Other errors are raised.
+    """
+    if supports_same_shower(model):
+        try:
+            return get_frequency_spectrum(energy, viewing_angle, samples, dt, shower_type, ior, distance, model, True)
+        except TypeError as e:
+            if not _is_same_shower_unsupported(e):
+                raise
+            logger.warning('%s does not support same_shower, computing it without: %s', model, e)
+            same_shower_support[model] = False
+        except AttributeError as e:
+            if not _is_shower_not_drawn(e):
+                raise
+            _compute_frequency_spectrum(energy, viewing_angle, samples, dt, shower_type, ior, distance, model, same_shower=False)
+            return get_frequency_spectrum(energy, viewing_angle, samples, dt, shower_type, ior, distance, model, True)
+    return get_frequency_spectrum(energy, viewing_angle, samples, dt, shower_type, ior, distance, model, False)
+
+
+def compute_shower_spectrum_in_worker(energy, viewing_angle, samples, dt, shower_type, ior, distance, model, same_shower):
+    """
+    compute_shower_spectrum for worker processes, which start from the
+    same_shower support known to the server and return the spectrum with the
+    support they found, to be recorded by the server.
+    """
+    same_shower_support[model] = same_shower
+    spectrum = compute_shower_spectrum(energy, viewing_angle, samples, dt, shower_type, ior, distance, model)
+    return np.asarray(spectrum), same_shower_support[model]
+
+
+def is_cached(energy, viewing_angle, samples, dt, shower_type, ior, distance, model):
+    """
+    Returns whether get_shower_spectrum can return the spectrum without
+    computing it.
+    """
+    if spectrum_grid.lookup(energy, viewing_angle, samples, dt, shower_type, ior, distance, model) is not None:
+        return True
+    key = _make_key(energy, viewing_angle, samples, dt, shower_type, ior, distance, model, supports_same_shower(model))
+    return key in spectrum_cache or key in shared_spectrum_cache
+
+
+def get_shower_spectrum(energy, viewing_angle, samples, dt, shower_type, ior, distance, model):
+    """
+    Returns the Askaryan spectrum, served from the precomputed spectrum grid
+    if the parameters fall on a grid point and computed otherwise.
+    """
+    spectrum = spectrum_grid.lookup(energy, viewing_angle, samples, dt, shower_type, ior, distance, model)
+    if spectrum is None:
+        spectrum = compute_shower_spectrum(energy, viewing_angle, samples, dt, shower_type, ior, distance, model)
+    return spectrum
@@ -0,0 +1,571 @@
+"""
+Export of the signal chain to npz or HDF5 archives, and loading them back.
+
+GET /export/snapshot?format=npz&parameters={...} returns the arrays of one
+parameter point (see batch.default_parameters for the names), taken from the
+result store and the memoized stages, so that exporting what the viewer shows
+does not compute anything again. POST /export/bulk takes a parameter file as
+used by batch.py and streams the traces of all parameter points, simulated in
+the process pool of process_pool.
+
+Archives written without compression can be loaded with memory maps, without
+copying the arrays. Compressed ones are decompressed once. A loaded snapshot
+is kept in the result store under the name of its file, which only the
+session that uploaded it knows, so that it never replaces a computed result.
+Each server process loads it from the file on its first lookup.
+"""
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import struct
+import tempfile
+import zipfile
+import numpy as np
+from NuRadioReco.utilities import units
+import signal_chain
+import detector_response
+import antenna_response
+import ice_attenuation
+import spectrum_grid
+import background_jobs
+import batch
+import process_pool
+from result_store import result_store
+
+formats = ['npz', 'hdf5']
+hdf5_signature = b'\x89HDF\r\n\x1a\n'
+stream_chunk_size = 2 ** 20
+default_bulk_chunk_size = 1000
+# Largest number of parameter points of one bulk export
+max_bulk_parameter_sets = int(os.environ.get('NSV_BULK_MAX_PARAMETER_SETS', 100000))
+# Total size of the uploaded snapshots that are kept, in bytes
+max_snapshot_bytes = int(os.environ.get('NSV_SNAPSHOT_MAX_BYTES', 2 ** 30))
+
+
+def get_snapshot_directory():
+    directory = os.environ.get('NSV_SNAPSHOT_DIR', os.path.join(tempfile.gettempdir(), 'nsv-snapshots'))
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+# Ranges of the sliders, and the choices of the other inputs, that a snapshot
+# can be requested for
+parameter_ranges = {
+    'log_energy': (16., 20.),
+    'viewing_angle': (-10., 10.),
+    'propagation_length': (0., 5.),
+    'depth': (0., 3000.),
+    'path_zenith': (0., 180.),
+    'polarization_angle': (-180., 180.),
+    'zenith': (0., 180.),
+    'azimuth': (0., 360.)
+}
+parameter_choices = {
+    'shower_type': spectrum_grid.shower_types,
+    'model': spectrum_grid.models,
+    'attenuation_model': ice_attenuation.attenuation_models,
+    'antenna_type': antenna_response.antenna_types,
+    'amplifier_type': detector_response.amplifier_types,
+    'samples': signal_chain.sample_counts,
+    'sampling_rate': signal_chain.sampling_rates
+}
+filter_band_range = (0., .5)
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and np.isfinite(value)
+
+
+def check_parameters(parameters):
+    """
+    Raises a ValueError unless parameters is a dict of parameters of
+    batch.default_parameters, with the values the inputs of the viewer can
+    take (the sampling rate in GHz).
+    """
+    if not isinstance(parameters, dict):
+        raise ValueError('parameters have to be a JSON object')
+    unknown = sorted(set(parameters) - set(batch.default_parameters))
+    if unknown:
+        raise ValueError('unknown parameters: {}'.format(', '.join(unknown)))
+    for name, (minimum, maximum) in parameter_ranges.items():
+        value = parameters.get(name)
+        if name == 'path_zenith' and value is None:
+            continue
+        if not _is_number(value) or not minimum <= value <= maximum:
+            raise ValueError('{} has to be a number from {} to {}'.format(name, minimum, maximum))
+    for name, choices in parameter_choices.items():
+        if parameters.get(name) not in choices or isinstance(parameters.get(name), bool):
+            raise ValueError('{} has to be one of {}'.format(name, ', '.join(str(choice) for choice in choices)))
+    if not isinstance(parameters['samples'], int):
+        raise ValueError('samples has to be an integer')
+    filter_band = parameters.get('filter_band')
+    if filter_band is not None:
+        if not isinstance(filter_band, (list, tuple)) or len(filter_band) != 2 or not all(_is_number(value) for value in filter_band) \
+                or not filter_band_range[0] <= filter_band[0] <= filter_band[1] <= filter_band_range[1]:
+            raise ValueError('filter_band has to be null or a range within [{}, {}]'.format(*filter_band_range))
+
+
+def get_efield_parameters(parameters):
+    """
+    Returns the parameters of signal_chain.get_propagated_efield, in the form
+    under which the viewer keeps the electric field in the result store.
+    """
+    return [
+        parameters['log_energy'],
+        parameters['viewing_angle'],
+        parameters['shower_type'],
+        parameters['model'],
+        parameters['propagation_length'],
+        parameters['attenuation_model'],
+        parameters['depth'],
+        parameters['path_zenith'],
+        parameters['samples'],
+        parameters['sampling_rate']
+    ]
+
+
+def get_voltage_parameters(efield_parameters, antenna_type, zenith, azimuth, amplifier_type, filter_band):
+    return [efield_parameters, antenna_type, zenith, azimuth, amplifier_type, filter_band]
+
+
+def get_snapshot(parameters):
+    """
+    Returns the arrays of every stage of the signal chain for one parameter
+    point. The electric field and voltage are taken from the result store if
+    the viewer has computed them, the responses from the stage caches.
+    """
+    samples = parameters['samples']
+    sampling_rate = parameters['sampling_rate']
+    filter_band = None if parameters['filter_band'] is None else tuple(parameters['filter_band'])
+    efield_parameters = get_efield_parameters(parameters)
+    efield = result_store.get(result_store.make_key('efield', efield_parameters))
+    if efield is None:
+        efield = signal_chain.get_efield(efield_parameters)
+    voltage_parameters = get_voltage_parameters(
+        efield_parameters,
+        parameters['antenna_type'],
+        parameters['zenith'],
+        parameters['azimuth'],
+        parameters['amplifier_type'],
+        filter_band
+    )
+    voltage = result_store.get(result_store.make_key('voltage', voltage_parameters))
+    if voltage is None:
+        channel_spectra, channel_traces = signal_chain.get_channel_voltage_components(efield['spectrum'], *voltage_parameters[1:], samples, sampling_rate)
+        voltage = {'spectra': channel_spectra, 'traces': channel_traces}
+    antenna_response_theta, antenna_response_phi = signal_chain.get_antenna_response(
+        parameters['antenna_type'],
+        parameters['zenith'],
+        parameters['azimuth'],
+        samples,
+        sampling_rate
+    )
+    polarization_angle = parameters['polarization_angle'] * units.deg
+    polarization = np.array([np.cos(polarization_angle), np.sin(polarization_angle)], dtype=np.float32)
+    return {
+        'times': signal_chain.get_times(samples, sampling_rate),
+        'freqs': signal_chain.get_frequencies(samples, sampling_rate),
+        'efield_trace': efield['trace'],
+        'efield_spectrum': efield['spectrum'],
+        'efield_trace_theta': efield['trace'] * polarization[0],
+        'efield_trace_phi': efield['trace'] * polarization[1],
+        'efield_spectrum_theta': efield['spectrum'] * polarization[0],
+        'efield_spectrum_phi': efield['spectrum'] * polarization[1],
+        'antenna_response_theta': antenna_response_theta,
+        'antenna_response_phi': antenna_response_phi,
+        'amplifier_response': detector_response.get_amplifier_response(parameters['amplifier_type'], samples, sampling_rate),
+        'filter_response': detector_response.get_filter_response(filter_band, samples, sampling_rate),
+        'voltage_trace_components': voltage['traces'],
+        'voltage_spectrum_components': voltage['spectra'],
+        'voltage_trace': polarization.dot(voltage['traces']),
+        'voltage_spectrum': polarization.dot(voltage['spectra'])
+    }
+
+
+def write_npz(output, arrays, parameters, compress=True):
+    save = np.savez_compressed if compress else np.savez
+    save(output, parameters=np.array(json.dumps(parameters)), **arrays)
+
+
+def write_hdf5(output, arrays, parameters, compress=True):
+    import h5py
+    with h5py.File(output, 'w') as f:
+        f.attrs['parameters'] = json.dumps(parameters)
+        for name, values in arrays.items():
+            f.create_dataset(name, data=values, compression='gzip' if compress else None)
+
+
+def dumps_snapshot(arrays, parameters, archive_format='npz', compress=True):
+    output = io.BytesIO()
+    if archive_format == 'npz':
+        write_npz(output, arrays, parameters, compress)
+    else:
+        write_hdf5(output, arrays, parameters, compress)
+    return output.getvalue()
+
+
+def _memmap_npz(filename):
+    """
+    Memory-maps the uncompressed members of an npz archive and reads the
+    compressed ones.
+    """
+    arrays = {}
+    with open(filename, 'rb') as f, zipfile.ZipFile(f) as archive:
+        for info in archive.infolist():
+            name = info.filename[:-len('.npy')]
+            if info.compress_type != zipfile.ZIP_STORED:
+                with archive.open(info) as member:
+                    arrays[name] = np.lib.format.read_array(member)
+                continue
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack('<HH', f.read(4))
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            if len(shape) == 0 or dtype.hasobject or np.prod(shape) == 0:
+                f.seek(info.header_offset + 30 + name_length + extra_length)
+                arrays[name] = np.lib.format.read_array(f)
+            else:
+                arrays[name] = np.memmap(filename, dtype=dtype, mode='r', offset=f.tell(), shape=shape, order='F' if fortran_order else 'C')
+    parameters = json.loads(str(arrays.pop('parameters')))
+    return arrays, parameters
+
+
+def _memmap_hdf5(filename):
+    """
+    Memory-maps the contiguous, uncompressed datasets of an HDF5 file and
+    reads the others.
+    """
+    import h5py
+    arrays = {}
+    with h5py.File(filename, 'r') as f:
+        parameters = json.loads(f.attrs['parameters'])
+        for name, dataset in f.items():
+            offset = dataset.id.get_offset()
+            if offset is None or dataset.chunks is not None:
+                arrays[name] = dataset[()]
+            else:
+                arrays[name] = np.memmap(filename, dtype=dataset.dtype, mode='r', offset=offset, shape=dataset.shape)
+    return arrays, parameters
+
+
+def load_snapshot(filename):
+    """
+    Returns the arrays and parameters of a snapshot archive. Arrays stored
+    without compression are read-only memory maps of the file.
+    """
+    with open(filename, 'rb') as f:
+        signature = f.read(len(hdf5_signature))
+    if signature == hdf5_signature:
+        return _memmap_hdf5(filename)
+    return _memmap_npz(filename)
+
+
+def _prune_snapshots(directory, keep):
+    """
+    Deletes the least recently saved snapshots until the others fit into
+    max_snapshot_bytes. Arrays already memory-mapped from a deleted file stay
+    readable.
+    """
+    snapshots = []
+    for name in os.listdir(directory):
+        filename = os.path.join(directory, name)
+        if filename != keep and os.path.isfile(filename) and not name.endswith('.part'):
+            stat = os.stat(filename)
+            snapshots.append((stat.st_mtime, stat.st_size, filename))
+    total_size = os.path.getsize(keep) + sum(size for mtime, size, filename in snapshots)
+    for mtime, size, filename in sorted(snapshots):
+        if total_size <= max_snapshot_bytes:
+            break
+        try:
+            os.remove(filename)
+        except OSError:
+            continue
+        total_size -= size
+
+
+def save_snapshot(data):
+    """
+    Writes an uploaded archive to the snapshot directory, named after its
+    content, and returns its name in that directory. The file is kept, since the arrays
+    loaded from it are memory maps, but the directory is limited to
+    max_snapshot_bytes by deleting the oldest snapshots.
+    """
+    if len(data) > max_snapshot_bytes:
+        raise ValueError('the snapshot is larger than {} bytes'.format(max_snapshot_bytes))
+    directory = get_snapshot_directory()
+    extension = '.hdf5' if data.startswith(hdf5_signature) else '.npz'
+    filename = os.path.join(directory, hashlib.sha1(data).hexdigest() + extension)
+    if os.path.isfile(filename):
+        os.utime(filename)
+    else:
+        with open(filename + '.part', 'wb') as f:
+            f.write(data)
+        os.replace(filename + '.part', filename)
+    _prune_snapshots(directory, filename)
+    return os.path.basename(filename)
+
+
+def _check_array(arrays, name, shape, kind):
+    if name not in arrays:
+        raise ValueError('the snapshot has no {}'.format(name))
+    array = arrays[name]
+    if array.shape != shape or array.dtype.kind != kind:
+        raise ValueError('{} has shape {} and dtype {}, expected shape {} and kind {}'.format(
+            name, array.shape, array.dtype, shape, kind
+        ))
+
+
+def check_snapshot(arrays, parameters):
+    """
+    Raises a ValueError unless the electric field and voltage of a snapshot
+    have the shapes and dtypes that its samples and sampling rate imply.
+    """
+    samples = parameters['samples']
+    sampling_rate = parameters['sampling_rate']
+    if not isinstance(samples, int) or isinstance(samples, bool) or samples < 2:
+        raise ValueError('samples has to be an integer of at least 2')
+    if not isinstance(sampling_rate, (int, float)) or isinstance(sampling_rate, bool) or not 0. < sampling_rate < np.inf:
+        raise ValueError('sampling_rate has to be a positive number')
+    n_freqs = samples // 2 + 1
+    _check_array(arrays, 'efield_trace', (samples,), 'f')
+    _check_array(arrays, 'efield_spectrum', (n_freqs,), 'c')
+    _check_array(arrays, 'voltage_trace_components', (2, samples), 'f')
+    _check_array(arrays, 'voltage_spectrum_components', (2, n_freqs), 'c')
+
+
+# Names under which save_snapshot keeps the uploaded archives
+snapshot_name_pattern = re.compile(r'[0-9a-f]{40}\.(npz|hdf5)')
+
+
+def get_snapshot_keys(name):
+    return result_store.make_key('snapshot-efield', [name]), result_store.make_key('snapshot-voltage', [name])
+
+
+def get_snapshot_voltage_parameters(parameters):
+    filter_band = None if parameters['filter_band'] is None else tuple(parameters['filter_band'])
+    return get_voltage_parameters(
+        get_efield_parameters(parameters),
+        parameters['antenna_type'],
+        parameters['zenith'],
+        parameters['azimuth'],
+        parameters['amplifier_type'],
+        filter_band
+    )
+
+
+def load_into_store(name):
+    """
+    Loads a snapshot saved by save_snapshot, given by its file name in the
+    snapshot directory, and puts its electric field and voltage into the
+    result store under that name, which the lookups of the viewer only use
+    through the reference returned by get_snapshot_reference. Returns the
+    parameters of the snapshot.
+    """
+    if snapshot_name_pattern.fullmatch(name) is None:
+        raise ValueError('{} is not the name of a snapshot'.format(name))
+    arrays, parameters = load_snapshot(os.path.join(get_snapshot_directory(), name))
+    check_snapshot(arrays, parameters)
+    result_store.put('snapshot-efield', [name], {
+        'spectrum': arrays['efield_spectrum'],
+        'trace': arrays['efield_trace'],
+        'samples': parameters['samples'],
+        'sampling_rate': parameters['sampling_rate']
+    })
+    result_store.put('snapshot-voltage', [name], {
+        'spectra': arrays['voltage_spectrum_components'],
+        'traces': arrays['voltage_trace_components']
+    })
+    return parameters
+
+
+def _get_snapshot_result(name, key):
+    """
+    Returns a result of a loaded snapshot from the result store. Other server
+    processes, or this one after the result was evicted, load the snapshot
+    from its file again. Returns None if it has been deleted since.
+    """
+    result = result_store.get(key)
+    if result is None:
+        try:
+            load_into_store(name)
+        except (ValueError, KeyError, OSError, zipfile.BadZipFile):
+            return None
+        result = result_store.get(key)
+    return result
+
+
+def _normalize(parameters):
+    return json.loads(json.dumps(parameters))
+
+
+def get_snapshot_reference(snapshot, efield_parameters):
+    """
+    Returns the name of a loaded snapshot and the keys of its electric field
+    and voltage, with the voltage parameters they are valid for, if the
+    snapshot (as stored by the upload callback) is of the given electric
+    field parameters, and None otherwise.
+    """
+    if snapshot is None or _normalize(efield_parameters) != _normalize(get_efield_parameters(snapshot['parameters'])):
+        return None
+    efield_key, voltage_key = get_snapshot_keys(snapshot['name'])
+    return {
+        'name': snapshot['name'],
+        'efield_key': efield_key,
+        'voltage_key': voltage_key,
+        'voltage_parameters': _normalize(get_snapshot_voltage_parameters(snapshot['parameters']))
+    }
+
+
+def get_snapshot_efield(snapshot_reference):
+    """
+    Returns the electric field of the snapshot in a reference returned by
+    get_snapshot_reference, or None if it is not available.
+    """
+    return _get_snapshot_result(snapshot_reference['name'], snapshot_reference['efield_key'])
+
+
+def get_snapshot_voltage(reference, voltage_parameters):
+    """
+    Returns the voltage of the snapshot in an electric field reference if it
+    is of the given voltage parameters, and None otherwise.
+    """
+    snapshot = reference.get('snapshot')
+    if snapshot is None or snapshot['voltage_parameters'] != _normalize(voltage_parameters):
+        return None
+    return _get_snapshot_result(snapshot['name'], snapshot['voltage_key'])
+
+
+class _StreamBuffer(io.RawIOBase):
+    """
+    Unseekable file object that collects what is written to it until it is
+    taken with pop, for streaming a zip archive while it is being written.
+    """
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iterate_bulk_npz(parameter_sets, chunk_size, workers):
+    """
+    Yields a zip archive with one npz file per chunk of parameter points,
+    as the chunks are simulated.
+    """
+    stream = _StreamBuffer()
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_STORED) as archive:
+        for i_start, chunk, results in batch.iterate_chunks(parameter_sets, chunk_size, workers):
+            output = io.BytesIO()
+            np.savez_compressed(output, **batch.add_parameters(results, chunk))
+            archive.writestr('traces_{:06d}.npz'.format(i_start // chunk_size), output.getvalue())
+            yield stream.pop()
+    yield stream.pop()
+
+
+def iterate_bulk_hdf5(parameter_sets, chunk_size, workers):
+    """
+    Writes the HDF5 file to a temporary directory, which HDF5 needs to be
+    able to seek, and yields its content.
+    """
+    directory = tempfile.mkdtemp(dir=get_snapshot_directory())
+    try:
+        output = os.path.join(directory, 'traces')
+        batch.write_hdf5(parameter_sets, output, chunk_size, workers)
+        with open(output + '.hdf5', 'rb') as f:
+            data = f.read(stream_chunk_size)
+            while data:
+                yield data
+                data = f.read(stream_chunk_size)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def init_app(server):
+    import flask
+
+    def get_format():
+        archive_format = flask.request.args.get('format', 'npz')
+        if archive_format not in formats:
+            flask.abort(400, 'format has to be one of {}'.format(', '.join(formats)))
+        return archive_format
+
+    @server.route('/export/snapshot')
+    def export_snapshot():
+        archive_format = get_format()
+        try:
+            requested_parameters = json.loads(flask.request.args.get('parameters', '{}'))
+            if not isinstance(requested_parameters, dict):
+                raise ValueError('parameters have to be a JSON object')
+            parameters = dict(batch.default_parameters, sampling_rate=batch.default_parameters['sampling_rate'] / units.GHz)
+            parameters.update(requested_parameters)
+            check_parameters(parameters)
+        except ValueError as e:
+            flask.abort(400, str(e))
+        parameters['sampling_rate'] = parameters['sampling_rate'] * units.GHz
+        emission_parameters = (
+            parameters['log_energy'],
+            parameters['viewing_angle'],
+            parameters['shower_type'],
+            parameters['model'],
+            parameters['samples'],
+            parameters['sampling_rate']
+        )
+        if background_jobs.needs_background_job(emission_parameters):
+            # Slow models are computed in the background rather than in the request
+            job = background_jobs.jobs.submit(emission_parameters)
+            if job.error is not None:
+                flask.abort(500, 'the spectrum of {} could not be computed: {}'.format(parameters['model'], job.error))
+            response = flask.Response('the spectrum of {} is being computed, retry later'.format(parameters['model']), status=503)
+            response.headers['Retry-After'] = '10'
+            return response
+        compress = flask.request.args.get('compress', '1') != '0'
+        data = dumps_snapshot(get_snapshot(parameters), parameters, archive_format, compress)
+        response = flask.Response(data, mimetype='application/octet-stream')
+        response.headers['Content-Disposition'] = 'attachment; filename=snapshot.{}'.format(archive_format)
+        return response
+
+    @server.route('/export/bulk', methods=['POST'])
+    def export_bulk():
+        archive_format = get_format()
+        request = flask.request.get_json(force=True, silent=True)
+        if not isinstance(request, dict) or not isinstance(request.get('parameters'), dict):
+            flask.abort(400, 'the request body has to be a JSON object with a parameters object')
+        try:
+            parameter_sets = batch.make_parameter_sets(request['parameters'], request.get('product', False), max_bulk_parameter_sets)
+        except ValueError as e:
+            flask.abort(400, str(e))
+        max_workers = process_pool.max_workers
+        try:
+            chunk_size = int(request.get('chunk_size', default_bulk_chunk_size))
+            workers = int(request.get('workers', max_workers))
+        except (TypeError, ValueError):
+            flask.abort(400, 'chunk_size and workers have to be integers')
+        if chunk_size < 1:
+            flask.abort(400, 'chunk_size has to be at least 1')
+        if not 1 <= workers <= max_workers:
+            flask.abort(400, 'workers has to be between 1 and {}'.format(max_workers))
+        if archive_format == 'npz':
+            stream = iterate_bulk_npz(parameter_sets, chunk_size, workers)
+            filename = 'traces.zip'
+        else:
+            stream = iterate_bulk_hdf5(parameter_sets, chunk_size, workers)
+            filename = 'traces.hdf5'
+        response = flask.Response(flask.stream_with_context(stream), mimetype='application/octet-stream')
+        response.headers['Content-Disposition'] = 'attachment; filename={}'.format(filename)
+        return response
@@ -0,0 +1,125 @@
+from dash.dependencies import Input, Output, State, ClientsideFunction
+import dash_core_components as dcc
+import dash_html_components as html
+import dash
+import dash.exceptions
+import base64
+import json
+import zipfile
+from NuRadioReco.utilities import units
+from app import app, server
+import export
+
+export.init_app(server)
+
+layout = html.Div([
+    html.Div([
+        html.Div([
+            html.Div('Snapshot', className='panel-heading'),
+            html.Div([
+                html.Div([
+                    html.A('Download npz', id='snapshot-npz-link', href='', download='snapshot.npz', target='_blank'),
+                    html.Span(' | '),
+                    html.A('Download HDF5', id='snapshot-hdf5-link', href='', download='snapshot.hdf5', target='_blank'),
+                    dcc.Checklist(
+                        id='snapshot-compress-checklist',
+                        options=[
+                            {'label': 'Compress (uncompressed archives load as memory maps)', 'value': 'compress'}
+                        ],
+                        value=['compress']
+                    )
+                ], className='input-group'),
+                html.Div([
+                    dcc.Upload(
+                        id='snapshot-upload',
+                        children=html.Div('Drop a snapshot here or click to load it'),
+                        multiple=False,
+                        style={'borderWidth': '1px', 'borderStyle': 'dashed', 'padding': '10px', 'textAlign': 'center'}
+                    ),
+                    html.Div(id='snapshot-status'),
+                    html.Div(id='snapshot-storage', children=json.dumps(None), style={'display': 'none'})
+                ], className='input-group')
+            ], className='panel-body')
+        ], className='panel panel-default')
+    ], style={'flex': '1'})
+], style={'display': 'flex'})
+
+
+app.clientside_callback(
+    ClientsideFunction(namespace='signal_chain', function_name='snapshot_links'),
+    [Output('snapshot-npz-link', 'href'),
+    Output('snapshot-hdf5-link', 'href'),
+    Output('snapshot-npz-link', 'children'),
+    Output('snapshot-hdf5-link', 'children')],
+    [Input('efield-trace-storage', 'children'),
+    Input('polarization-angle-slider', 'value'),
+    Input('antenna-type-radio-items', 'value'),
+    Input('signal-zenith-slider', 'value'),
+    Input('signal-azimuth-slider', 'value'),
+    Input('amplifier-type-dropdown', 'value'),
+    Input('filter-toggle-checklist', 'value'),
+    Input('filter-band-range-slider', 'value'),
+    Input('snapshot-compress-checklist', 'value')]
+)
+
+
+@app.callback(
+    [Output('snapshot-status', 'children'),
+    Output('snapshot-storage', 'children'),
+    Output('energy-slider', 'value'),
+    Output('viewing-angle-slider', 'value'),
+    Output('shower-type-radio-items', 'value'),
+    Output('shower-model-dropdown', 'value'),
+    Output('propagation-length-slider', 'value'),
+    Output('attenuation-model-radio-items', 'value'),
+    Output('ice-depth-slider', 'value'),
+    Output('depth-profile-checklist', 'value'),
+    Output('polarization-angle-slider', 'value'),
+    Output('antenna-type-radio-items', 'value'),
+    Output('signal-zenith-slider', 'value'),
+    Output('signal-azimuth-slider', 'value'),
+    Output('amplifier-type-dropdown', 'value'),
+    Output('filter-toggle-checklist', 'value'),
+    Output('filter-band-range-slider', 'value'),
+    Output('trace-samples-dropdown', 'value'),
+    Output('sampling-rate-dropdown', 'value')],
+    [Input('snapshot-upload', 'contents')],
+    [State('snapshot-upload', 'filename')]
+)
+def load_snapshot(contents, filename):
+    """
+    Stores the uploaded archive, puts its electric field and voltage into the
+    result store under its file name, keeps the name in this session's
+    snapshot storage and moves the sliders to its parameters, so that the
+    plots are drawn from the loaded arrays.
+    """
+    if contents is None:
+        raise dash.exceptions.PreventUpdate()
+    try:
+        name = export.save_snapshot(base64.b64decode(contents.split(',', 1)[1]))
+        parameters = export.load_into_store(name)
+    except (ValueError, KeyError, TypeError, OSError, zipfile.BadZipFile) as e:
+        return ['Could not load {}: {}'.format(filename, e)] + [dash.no_update] * 18
+    profile = parameters['path_zenith'] is not None
+    filter_band = parameters['filter_band']
+    return [
+        'Loaded {}'.format(filename),
+        json.dumps({'name': name, 'parameters': parameters}),
+        parameters['log_energy'],
+        parameters['viewing_angle'],
+        parameters['shower_type'],
+        [parameters['model']],
+        parameters['propagation_length'],
+        parameters['attenuation_model'],
+        parameters['depth'],
+        ['profile'] if profile else [],
+        parameters['polarization_angle'],
+        parameters['antenna_type'],
+        parameters['path_zenith'] if profile else parameters['zenith'],
+        parameters['azimuth'],
+        parameters['amplifier_type'],
+        [] if filter_band is None else ['filter'],
+        dash.no_update if filter_band is None else list(filter_band),
+        parameters['samples'],
+        parameters['sampling_rate'] / units.GHz
+    ]
@@ -0,0 +1,115 @@
+"""
+Attenuation of the radio signal in the ice. Attenuation lengths are tabulated
+per ice model on a depth and frequency grid, and attenuation factors per ice
+model and depth on a grid of propagation lengths covering the propagation
+length slider, so that propagation costs a table lookup and a multiply.
+Tables are built on first use and kept in caches limited in memory. Depths are
+given as positive distances below the surface.
+"""
+import os
+import numpy as np
+from NuRadioReco.utilities import units
+from cache import LRUCache, memoize
+import metrics
+
+# np.trapz is deprecated in favor of np.trapezoid since numpy 2.0
+trapezoid = getattr(np, 'trapezoid', None) or np.trapz
+
+attenuation_models = ['GL1', 'SP1', 'MB1']
+depth_grid = np.arange(0., 3000.1, 50.) * units.m
+propagation_length_grid = np.arange(0., 5.01, .1) * units.km
+# Number of points at which a depth-dependent attenuation profile is sampled
+path_steps = 101
+
+# Memory for the tables and the memoized attenuation factors together, in
+# bytes. A factor table of 65536 samples takes 6.7 MB.
+max_cache_bytes = int(os.environ.get('NSV_ATTENUATION_CACHE_BYTES', 64 * 2 ** 20))
+
+attenuation_length_tables = LRUCache(16, max_cache_bytes // 4)
+attenuation_factor_tables = LRUCache(64, max_cache_bytes // 2)
+
+
+def build_attenuation_length_table(attenuation_model, samples, sampling_rate):
+    """
+    Returns the attenuation lengths of shape (depth, frequency).
+    """
+    import NuRadioMC.utilities.attenuation
+    freqs = np.fft.rfftfreq(samples, 1. / sampling_rate)
+    with metrics.timed('attenuation_table'):
+        table = np.array([
+            NuRadioMC.utilities.attenuation.get_attenuation_length(depth, freqs, attenuation_model)
+            for depth in depth_grid
+        ])
+    table.flags.writeable = False
+    return table
+
+
+def get_attenuation_length_table(attenuation_model, samples, sampling_rate):
+    key = (attenuation_model, samples, sampling_rate)
+    return attenuation_length_tables.get_or_compute(key, build_attenuation_length_table, *key)
+
+
+def get_attenuation_lengths(attenuation_model, depths, samples, sampling_rate):
+    """
+    Returns the attenuation lengths at the given depths, linearly interpolated
+    between the rows of the table, as an array of shape (depth, frequency).
+    """
+    table = get_attenuation_length_table(attenuation_model, samples, sampling_rate)
+    positions = np.clip((np.asarray(depths) - depth_grid[0]) / (depth_grid[1] - depth_grid[0]), 0, len(depth_grid) - 1)
+    indices = np.minimum(np.floor(positions).astype(int), len(depth_grid) - 2)
+    weights = (positions - indices)[:, None]
+    return (1. - weights) * table[indices] + weights * table[indices + 1]
+
+
+def build_attenuation_factor_table(attenuation_model, depth, samples, sampling_rate):
+    """
+    Returns the attenuation factors at a fixed depth, of shape
+    (propagation length, frequency).
+    """
+    attenuation_length = get_attenuation_lengths(attenuation_model, [depth], samples, sampling_rate)[0]
+    table = np.exp(-propagation_length_grid[:, None] / attenuation_length[None, :]).astype(np.float32)
+    table.flags.writeable = False
+    return table
+
+
+def get_attenuation_factor_table(attenuation_model, depth, samples, sampling_rate):
+    key = (attenuation_model, depth, samples, sampling_rate)
+    return attenuation_factor_tables.get_or_compute(key, build_attenuation_factor_table, *key)
+
+
+def get_profile_attenuation_factor(attenuation_model, propagation_length, depth, path_zenith, samples, sampling_rate):
+    """
+    Returns the attenuation factor for a straight path of the given length
+    from a receiver at the given depth towards path_zenith, with the
+    attenuation length following the depth along the path. The path is
+    clipped to the depth range of the table.
+    """
+    path = np.linspace(0., propagation_length, path_steps)
+    depths = np.clip(depth - path * np.cos(path_zenith), depth_grid[0], depth_grid[-1])
+    attenuation_lengths = get_attenuation_lengths(attenuation_model, depths, samples, sampling_rate)
+    return np.exp(-trapezoid(1. / attenuation_lengths, path, axis=0)).astype(np.float32)
+
+
+@memoize(max_size=256, max_bytes=max_cache_bytes // 4)
+def get_attenuation_factor(attenuation_model, propagation_length, depth, path_zenith, samples, sampling_rate):
+    """
+    Returns the attenuation factor per frequency. If path_zenith is None, the
+    attenuation length at the given depth is used for the whole path.
+    """
+    if path_zenith is not None:
+        factor = get_profile_attenuation_factor(attenuation_model, propagation_length, depth, path_zenith, samples, sampling_rate)
+    else:
+        step = propagation_length_grid[1] - propagation_length_grid[0]
+        i_length = int(round(propagation_length / step))
+        if i_length < len(propagation_length_grid) and np.isclose(propagation_length_grid[i_length], propagation_length):
+            factor = get_attenuation_factor_table(attenuation_model, depth, samples, sampling_rate)[i_length]
+        else:
+            attenuation_length = get_attenuation_lengths(attenuation_model, [depth], samples, sampling_rate)[0]
+            factor = np.exp(-propagation_length / attenuation_length).astype(np.float32)
+    factor.flags.writeable = False
+    return factor
+
+
+metrics.register_cache('attenuation_length_tables', attenuation_length_tables)
+metrics.register_cache('attenuation_factor_tables', attenuation_factor_tables)
+metrics.register_cache('get_attenuation_factor', get_attenuation_factor.cache)
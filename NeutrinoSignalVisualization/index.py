@@ -1,16 +1,26 @@
-from dash.dependencies import Input, Output, State
+from dash.dependencies import Input, Output, State, ClientsideFunction
 import dash_core_components as dcc
 import dash_html_components as html
 import dash
+import dash.exceptions
 import json
-import plotly.subplots
-import plotly.graph_objs as go
 import numpy as np
-from NuRadioReco.utilities import units, fft
-import NuRadioMC.utilities.attenuation
-import NuRadioMC.SignalGen.askaryan
+from NuRadioReco.utilities import units
+import signal_chain
+from downsampling import get_downsample_indices
+from result_store import result_store
+from request_coalescing import coalescer
 import voltage_trace
+import station_trace
+import sweep_animation
+import trigger_efficiency
+import export_panel
+import export
+import background_jobs
 from app import app
+import startup
+import metrics
+import transport
 
 app.title = 'Radio Signal Simulator'
 
@@ -98,8 +108,8 @@ app.layout = html.Div([
                                 {'label': 'Alvarez2000', 'value': 'Alvarez2000'},
                                 {'label': 'ZHS1992', 'value': 'ZHS1992'}
                             ],
-                            multi=False,
-                            value='ARZ2020'
+                            multi=True,
+                            value=['ARZ2020']
                         )
                     ], className='input-group')
                 ], className='panel-body')
@@ -137,6 +147,63 @@ app.layout = html.Div([
                             value='GL1',
                             labelStyle={'padding': '0 5px'}
                         )
+                    ], className='input-group'),
+                    html.Div([
+                        html.Div('Ice Depth'),
+                        dcc.Slider(
+                            id='ice-depth-slider',
+                            min=0,
+                            max=3000,
+                            step=50,
+                            value=200,
+                            marks={
+                                0: '0m',
+                                500: '500m',
+                                1000: '1km',
+                                1500: '1.5km',
+                                2000: '2km',
+                                2500: '2.5km',
+                                3000: '3km'
+                            }
+                        ),
+                        dcc.Checklist(
+                            id='depth-profile-checklist',
+                            options=[
+                                {'label': 'Depth profile along the signal direction', 'value': 'profile'}
+                            ],
+                            value=[]
+                        )
+                    ], className='input-group')
+                ], className='panel-body')
+            ], className='panel panel-default'),
+            html.Div([
+                html.Div('Trace', className='panel-heading'),
+                html.Div([
+                    html.Div([
+                        html.Div('Trace Length'),
+                        dcc.Dropdown(
+                            id='trace-samples-dropdown',
+                            options=[
+                                {'label': '{} samples'.format(samples), 'value': samples}
+                                for samples in signal_chain.sample_counts
+                            ],
+                            multi=False,
+                            clearable=False,
+                            value=signal_chain.default_samples
+                        )
+                    ], className='input-group'),
+                    html.Div([
+                        html.Div('Sampling Rate'),
+                        dcc.Dropdown(
+                            id='sampling-rate-dropdown',
+                            options=[
+                                {'label': '{} GHz'.format(sampling_rate), 'value': sampling_rate}
+                                for sampling_rate in signal_chain.sampling_rates
+                            ],
+                            multi=False,
+                            clearable=False,
+                            value=signal_chain.default_sampling_rate / units.GHz
+                        )
                     ], className='input-group')
                 ], className='panel-body')
             ], className='panel panel-default')
@@ -144,106 +211,237 @@ app.layout = html.Div([
         html.Div([
             html.Div('Electric Field', className='panel-heading'),
             html.Div([
-                dcc.Graph(id='electric-field-plot')
+                dcc.Graph(id='electric-field-plot'),
+                html.Div(id='electric-field-progress'),
+                dcc.Interval(id='electric-field-job-interval', interval=500, disabled=True)
             ], className='panel-body')
         ], className='panel panel-default', style={'flex':'4'})
     ], style={'display': 'flex'}),
     html.Div(id='efield-trace-storage', children=json.dumps(None), style={'display': 'none'}),
-    voltage_trace.layout
+    html.Div(id='electric-field-data', children=json.dumps(None), style={'display': 'none'}),
+    voltage_trace.layout,
+    station_trace.layout,
+    sweep_animation.layout,
+    trigger_efficiency.layout,
+    export_panel.layout
 ])
 
+startup.mark_phase('layout')
+
+
+def make_electric_field_data(efield):
+    """
+    Returns the arrays of the electric field plot for the unpolarized field.
+    The browser weights them with the polarization angle and converts them to
+    the units of the plot.
+    """
+    times = signal_chain.get_times(efield['samples'], efield['sampling_rate'])
+    freqs = signal_chain.get_frequencies(efield['samples'], efield['sampling_rate'])
+    spectrum = np.abs(efield['spectrum'])
+    trace_indices = get_downsample_indices(efield['trace'])
+    spectrum_indices = get_downsample_indices(spectrum)
+    return {
+        'times': times[trace_indices],
+        'trace': efield['trace'][trace_indices],
+        'freqs': freqs[spectrum_indices],
+        'spectrum': spectrum[spectrum_indices],
+        'units': {
+            'time': units.ns,
+            'frequency': units.MHz,
+            'trace': units.mV / units.m,
+            'spectrum': units.mV / units.m / units.GHz
+        }
+    }
+
 
 @app.callback(
-    [Output('electric-field-plot', 'figure'),
-    Output('efield-trace-storage', 'children')],
+    [Output('electric-field-data', 'children'),
+    Output('efield-trace-storage', 'children'),
+    Output('electric-field-progress', 'children'),
+    Output('electric-field-job-interval', 'disabled')],
     [Input('energy-slider', 'value'),
     Input('viewing-angle-slider', 'value'),
     Input('shower-type-radio-items', 'value'),
-    Input('polarization-angle-slider', 'value'),
     Input('shower-model-dropdown', 'value'),
     Input('propagation-length-slider', 'value'),
-    Input('attenuation-model-radio-items', 'value')]
+    Input('attenuation-model-radio-items', 'value'),
+    Input('ice-depth-slider', 'value'),
+    Input('depth-profile-checklist', 'value'),
+    Input('signal-zenith-slider', 'value'),
+    Input('trace-samples-dropdown', 'value'),
+    Input('sampling-rate-dropdown', 'value'),
+    Input('electric-field-job-interval', 'n_intervals'),
+    Input('snapshot-storage', 'children')],
+    [State('efield-trace-storage', 'children')]
 )
 def update_electric_field_plot(
     log_energy,
     viewing_angle,
     shower_type,
-    polarization_angle,
-    model,
+    models,
     propagation_length,
-    attenuation_model):
+    attenuation_model,
+    depth,
+    depth_profile,
+    signal_zenith,
+    samples,
+    sampling_rate,
+    n_intervals,
+    snapshot,
+    stored_efield):
+    """
+    With the depth profile, the attenuation is integrated along the signal
+    direction, so the signal zenith only matters if it is turned on.
+    Slow models that are not cached are computed in background jobs and left
+    out of the plot until they have finished, while the interval polls for
+    them. If no selected model is ready, the preview model is shown. The
+    electric field of a snapshot loaded in this session is shown if its
+    parameters are selected.
+    """
+    triggered = [trigger['prop_id'] for trigger in dash.callback_context.triggered]
+    if 'profile' not in depth_profile and triggered == ['signal-zenith-slider.value']:
+        raise dash.exceptions.PreventUpdate()
+    if not models:
+        raise dash.exceptions.PreventUpdate()
+    sampling_rate = sampling_rate * units.GHz
+    jobs = []
+    ready_models = []
+    for model in models:
+        emission_parameters = (log_energy, viewing_angle, shower_type, model, samples, sampling_rate)
+        if background_jobs.needs_background_job(emission_parameters):
+            jobs.append(background_jobs.jobs.submit(emission_parameters))
+        else:
+            ready_models.append(model)
+    shown_models = ready_models or [background_jobs.preview_model]
+    running = any(job.error is None for job in jobs)
+    if triggered == ['electric-field-job-interval.n_intervals']:
+        stored_efield = json.loads(stored_efield)
+        if stored_efield is not None:
+            failed = stored_efield.get('failed', [])
+            failed_models = [entry['model'] for entry in failed]
+            if [entry['model'] for entry in stored_efield['models']] == [model for model in shown_models if model not in failed_models]:
+                return [dash.no_update, dash.no_update, make_job_progress(jobs, ready_models, failed), not running]
+    electric_field_data, efield_storage, failed = coalescer.run(
+        'electric-field',
+        build_electric_field_plot,
+        log_energy,
+        viewing_angle,
+        shower_type,
+        shown_models,
+        propagation_length,
+        attenuation_model,
+        depth,
+        signal_zenith if 'profile' in depth_profile else None,
+        samples,
+        sampling_rate,
+        json.loads(snapshot)
+    )
+    return [electric_field_data, efield_storage, make_job_progress(jobs, ready_models, failed), not running]
 
-    viewing_angle = viewing_angle * units.deg
-    polarization_angle = polarization_angle * units.deg
-    propagation_length  = propagation_length * units.km
-    energy = np.power(10., log_energy)
-    samples = 512
-    sampling_rate = 1.*units.GHz
-    ior = 1.78
-    cherenkov_angle = np.arccos(1./ior)
-    distance = 1.*units.km
-    try:
-        efield_spectrum = NuRadioMC.SignalGen.askaryan.get_frequency_spectrum(
-            energy,
-            cherenkov_angle + viewing_angle,
-            samples,
-            1./sampling_rate,
+
+def make_job_progress(jobs, ready_models, failed=()):
+    """
+    Returns the progress of the background jobs and the models whose
+    spectrum could not be computed, as given by build_electric_field_plot.
+    """
+    if len(jobs) == 0 and len(failed) == 0:
+        return None
+    failed_models = [entry['model'] for entry in failed]
+    shown_models = [model for model in ready_models if model not in failed_models]
+    shown = ', '.join(shown_models) if shown_models else background_jobs.preview_model
+    rows = [html.Div('{} failed: {}'.format(entry['model'], entry['error'])) for entry in failed]
+    for job in jobs:
+        if job.error is not None:
+            rows.append(html.Div('{} failed: {}'.format(job.model, job.error)))
+        else:
+            rows.append(html.Div([
+                html.Progress(value=str(background_jobs.jobs.get_progress(job)), max='1'),
+                html.Span(' Computing {}, showing {} until it has finished'.format(job.model, shown))
+            ]))
+    return rows
+
+
+def build_electric_field_plot(
+    log_energy,
+    viewing_angle,
+    shower_type,
+    models,
+    propagation_length,
+    attenuation_model,
+    depth,
+    path_zenith,
+    samples,
+    sampling_rate,
+    snapshot=None):
+    """
+    Returns the plot data of the electric fields of all models, a reference
+    to each of them in the result store, and the models whose spectrum
+    failed, which are left out. The first model is the one used by the
+    panels that show a single electric field. The models are either cached
+    or fast, as slow ones are computed in background jobs first, so their
+    spectra are computed here in turn. An electric field already in the
+    result store, or that of the loaded snapshot if it has the same
+    parameters, is used as it is.
+    """
+    references = []
+    model_data = []
+    failed = []
+    for model in models:
+        efield_parameters = [
+            log_energy,
+            viewing_angle,
             shower_type,
-            ior,
-            distance,
             model,
-            same_shower=True
-        )
-    except:
-        efield_spectrum = NuRadioMC.SignalGen.askaryan.get_frequency_spectrum(
-            energy,
-            cherenkov_angle + viewing_angle,
+            propagation_length,
+            attenuation_model,
+            depth,
+            path_zenith,
             samples,
-            1./sampling_rate,
-            shower_type,
-            ior,
-            distance,
-            model,
-            same_shower=False
-        )
-    freqs = np.fft.rfftfreq(samples, 1./sampling_rate)
-    if propagation_length > 0:
-        attenuation_length = NuRadioMC.utilities.attenuation.get_attenuation_length(200., freqs, attenuation_model)
-        efield_spectrum *= np.exp(-propagation_length/attenuation_length)
-    efield_spectrum_theta = efield_spectrum * np.cos(polarization_angle)
-    efield_spectrum_phi = efield_spectrum * np.sin(polarization_angle)
-    efield_trace = fft.freq2time(efield_spectrum, sampling_rate)
-    efield_trace_theta = efield_trace * np.cos(polarization_angle)
-    efield_trace_phi = efield_trace * np.sin(polarization_angle)
-    times = np.arange(samples) / sampling_rate
+            sampling_rate
+        ]
+        reference = {'model': model, 'parameters': efield_parameters}
+        snapshot_reference = export.get_snapshot_reference(snapshot, efield_parameters)
+        efield = None
+        if snapshot_reference is not None:
+            efield = export.get_snapshot_efield(snapshot_reference)
+        if efield is not None:
+            efield_key = snapshot_reference['efield_key']
+            reference['snapshot'] = snapshot_reference
+        else:
+            efield_key = result_store.make_key('efield', efield_parameters)
+            efield = result_store.get(efield_key)
+        if efield is None:
+            try:
+                with metrics.timed('emission'):
+                    signal_chain.get_emission_spectrum(log_energy, viewing_angle, shower_type, model, samples, sampling_rate)
+            except Exception as e:
+                failed.append({'model': model, 'error': repr(e)})
+                continue
+            coalescer.check_cancelled()
+            with metrics.timed('propagation'):
+                efield = signal_chain.get_efield(efield_parameters)
+            result_store.put('efield', efield_parameters, efield)
+        reference['key'] = efield_key
+        references.append(reference)
+        with metrics.timed('efield_figure'):
+            model_data.append(dict(make_electric_field_data(efield), model=model))
+    if len(references) == 0:
+        return [transport.dumps({'models': []}), json.dumps(None), failed]
+    return [
+        transport.dumps({'models': model_data}),
+        json.dumps({'key': references[0]['key'], 'parameters': references[0]['parameters'], 'models': references, 'failed': failed}),
+        failed
+    ]
+
+
+app.clientside_callback(
+    ClientsideFunction(namespace='signal_chain', function_name='electric_field_figure'),
+    Output('electric-field-plot', 'figure'),
+    [Input('electric-field-data', 'children'),
+    Input('polarization-angle-slider', 'value')]
+)
 
-    fig = plotly.subplots.make_subplots(rows=1, cols=2,
-        shared_xaxes=False, shared_yaxes=False,
-        vertical_spacing=0.01, subplot_titles=['Time Trace', 'Spectrum'])
-    fig.append_trace(go.Scatter(
-        x=times/units.ns,
-        y=efield_trace_theta/(units.mV/units.m),
-        name='E_theta (t)'
-    ),1,1)
-    fig.append_trace(go.Scatter(
-        x=times/units.ns,
-        y=efield_trace_phi/(units.mV/units.m),
-        name='E_phi (t)'
-    ),1,1)
-    fig.append_trace(go.Scatter(
-        x=freqs/units.MHz,
-        y=np.abs(efield_spectrum_theta)/(units.mV/units.m/units.GHz),
-        name='E_theta (f)'
-    ),1,2)
-    fig.append_trace(go.Scatter(
-        x=freqs/units.MHz,
-        y=np.abs(efield_spectrum_phi)/(units.mV/units.m/units.GHz),
-        name='E_phi (f)'
-    ),1,2)
-    fig.update_xaxes(title_text='t [ns]', row=1, col=1)
-    fig.update_xaxes(title_text='f [MHz]', row=1, col=2)
-    fig.update_yaxes(title_text='E[mV/m]', row=1, col=1)
-    fig.update_yaxes(title_text='E [mV/m/GHz]', row=1, col=2)
-    return [fig, json.dumps({'theta':efield_trace_theta.tolist(), 'phi':efield_trace_phi.tolist()})]
 
-app.run_server(debug=False, port=8080)
+if __name__ == '__main__':
+    startup.start_warm_up()
+    app.run_server(debug=False, port=8080)
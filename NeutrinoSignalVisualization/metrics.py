@@ -0,0 +1,168 @@
+"""
+Hot-path instrumentation: latency histograms per stage of the signal chain,
+response sizes and latencies per callback, and cache statistics, exposed in the
+Prometheus text format on /metrics. POST /metrics/profile profiles the next
+callback with cProfile, and GET /metrics/profile shows the result.
+"""
+import contextlib
+import cProfile
+import io
+import json
+import pstats
+import threading
+import time
+
+latency_buckets = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10.)
+size_buckets = (1.e3, 3.e3, 1.e4, 3.e4, 1.e5, 3.e5, 1.e6, 3.e6, 1.e7)
+
+
+class Histogram(object):
+    def __init__(self, name, description, label_name, buckets):
+        self.name = name
+        self.description = description
+        self.label_name = label_name
+        self.buckets = buckets
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label, value):
+        with self._lock:
+            if label not in self._values:
+                self._values[label] = [[0] * len(self.buckets), 0., 0]
+            counts, total, count = self._values[label]
+            for i_bucket, bucket in enumerate(self.buckets):
+                if value <= bucket:
+                    counts[i_bucket] += 1
+            self._values[label] = [counts, total + value, count + 1]
+
+    def render(self):
+        lines = [
+            '# HELP {} {}'.format(self.name, self.description),
+            '# TYPE {} histogram'.format(self.name)
+        ]
+        with self._lock:
+            for label, (counts, total, count) in sorted(self._values.items()):
+                for bucket, bucket_count in zip(self.buckets, counts):
+                    lines.append('{}_bucket{{{}="{}",le="{}"}} {}'.format(self.name, self.label_name, label, bucket, bucket_count))
+                lines.append('{}_bucket{{{}="{}",le="+Inf"}} {}'.format(self.name, self.label_name, label, count))
+                lines.append('{}_sum{{{}="{}"}} {}'.format(self.name, self.label_name, label, total))
+                lines.append('{}_count{{{}="{}"}} {}'.format(self.name, self.label_name, label, count))
+        return lines
+
+
+stage_latency = Histogram('nsv_stage_latency_seconds', 'Latency of the stages of the signal chain and the figure construction.', 'stage', latency_buckets)
+callback_latency = Histogram('nsv_callback_latency_seconds', 'Latency of Dash callback requests, including JSON serialization.', 'callback', latency_buckets)
+callback_response_bytes = Histogram('nsv_callback_response_bytes', 'Size of the serialized Dash callback responses.', 'callback', size_buckets)
+histograms = [stage_latency, callback_latency, callback_response_bytes]
+
+caches = {}
+counters = {}
+
+_profile_armed = threading.Event()
+_profile_lock = threading.Lock()
+_last_profile = None
+
+
+@contextlib.contextmanager
+def timed(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_latency.observe(stage, time.perf_counter() - start)
+
+
+def register_cache(name, cache):
+    """
+    Registers an object with a get_stats method returning hits and misses
+    (and optionally size), whose statistics are then exported.
+    """
+    caches[name] = cache
+
+
+def register_counter(name, description, function):
+    counters[name] = (description, function)
+
+
+def profile_call(function, *args):
+    """
+    Calls function(*args), profiling the call if a profile has been requested.
+    """
+    global _last_profile
+    if not _profile_armed.is_set():
+        return function(*args)
+    with _profile_lock:
+        armed = _profile_armed.is_set()
+        _profile_armed.clear()
+    if not armed:
+        return function(*args)
+    profile = cProfile.Profile()
+    try:
+        return profile.runcall(function, *args)
+    finally:
+        output = io.StringIO()
+        pstats.Stats(profile, stream=output).sort_stats('cumulative').print_stats(50)
+        _last_profile = '{}\n\n{}'.format(getattr(function, '__name__', repr(function)), output.getvalue())
+
+
+def render():
+    lines = []
+    for histogram in histograms:
+        lines += histogram.render()
+    for metric, key, description in [
+        ('nsv_cache_hits_total', 'hits', 'Cache hits.'),
+        ('nsv_cache_misses_total', 'misses', 'Cache misses.'),
+        ('nsv_cache_size', 'size', 'Number of entries in the cache.'),
+        ('nsv_cache_bytes', 'bytes', 'Memory held by the arrays in the cache, if it is limited in memory.'),
+        ('nsv_cache_hit_rate', 'hit_rate', 'Fraction of cache lookups that were hits.')
+    ]:
+        lines.append('# HELP {} {}'.format(metric, description))
+        lines.append('# TYPE {} {}'.format(metric, 'counter' if metric.endswith('_total') else 'gauge'))
+        for name, cache in sorted(caches.items()):
+            stats = cache.get_stats()
+            if key in stats:
+                lines.append('{}{{cache="{}"}} {}'.format(metric, name, stats[key]))
+    for name, (description, function) in sorted(counters.items()):
+        lines.append('# HELP {} {}'.format(name, description))
+        lines.append('# TYPE {} counter'.format(name))
+        lines.append('{} {}'.format(name, function()))
+    return '\n'.join(lines) + '\n'
+
+
+def _get_callback_name():
+    import flask
+    try:
+        body = json.loads(flask.request.get_data(as_text=True))
+    except ValueError:
+        return 'unknown'
+    return str(body.get('output', 'unknown')).strip('.')
+
+
+def init_app(server):
+    import flask
+
+    @server.before_request
+    def start_request_timer():
+        flask.g.metrics_start = time.perf_counter()
+
+    @server.after_request
+    def record_callback(response):
+        if flask.request.path.endswith('/_dash-update-component') and 'metrics_start' in flask.g:
+            callback = _get_callback_name()
+            callback_latency.observe(callback, time.perf_counter() - flask.g.metrics_start)
+            if not response.direct_passthrough:
+                callback_response_bytes.observe(callback, len(response.get_data()))
+        return response
+
+    @server.route('/metrics')
+    def metrics():
+        return flask.Response(render(), mimetype='text/plain; version=0.0.4')
+
+    @server.route('/metrics/profile', methods=['GET', 'POST'])
+    def profile():
+        if flask.request.method == 'POST':
+            _profile_armed.set()
+            return flask.Response('Profiling the next callback.\n', mimetype='text/plain')
+        if _last_profile is None:
+            return flask.Response('No profile has been recorded.\n', mimetype='text/plain', status=404)
+        return flask.Response(_last_profile, mimetype='text/plain')
@@ -0,0 +1,204 @@
+"""
+Thermal noise and trigger simulation. Noise is drawn as the white thermal
+noise of a matched 50 Ohm antenna, shaped by the amplifier and filter and
+added to the channel voltage. All realizations are processed as one batched
+(realization x sample) FFT, with random generators seeded from a fixed seed so
+that results are reproducible.
+"""
+import numpy as np
+import plotly.graph_objs as go
+from NuRadioReco.utilities import units, fft
+import detector_response
+import sweep
+from cache import memoize
+import metrics
+
+boltzmann_constant = 1.380649e-23  # J/K
+noise_temperature = 300.  # K
+resistance = 50.  # Ohm
+seed = 1234
+trigger_types = ['threshold', 'power']
+power_integration_window = 10. * units.ns
+
+# Maximum number of samples (points x realizations x samples) per batched FFT
+chunk_size = 2 ** 22
+
+
+def get_white_noise_rms(sampling_rate, temperature=noise_temperature):
+    """
+    Returns the rms voltage of thermal noise up to the Nyquist frequency.
+    """
+    bandwidth = .5 * sampling_rate / units.Hz
+    return np.sqrt(boltzmann_constant * temperature * resistance * bandwidth) * units.V
+
+
+def _get_chain_response(amplifier_type, filter_band, samples, sampling_rate):
+    return detector_response.get_detector_chain_response(amplifier_type, filter_band, samples, sampling_rate)
+
+
+@memoize(max_size=64)
+def get_noise_rms(amplifier_type, filter_band, samples, sampling_rate, temperature=noise_temperature):
+    """
+    Returns the expected rms voltage of the noise after amplifier and filter.
+    """
+    power_response = np.abs(_get_chain_response(amplifier_type, filter_band, samples, sampling_rate)) ** 2
+    weights = np.full(len(power_response), 2.)
+    weights[0] = 1.
+    if samples % 2 == 0:
+        weights[-1] = 1.
+    return get_white_noise_rms(sampling_rate, temperature) * np.sqrt(np.sum(weights * power_response) / samples)
+
+
+def get_noise_spectra(shape, amplifier_type, filter_band, samples, sampling_rate, rng, temperature=noise_temperature):
+    """
+    Returns noise spectra of the given shape (..., frequency), shaped by the
+    amplifier and filter.
+    """
+    noise_traces = rng.standard_normal(tuple(shape) + (samples,), dtype=np.float32)
+    noise_traces *= get_white_noise_rms(sampling_rate, temperature)
+    with metrics.timed('noise_fft'):
+        noise_spectra = fft.time2freq(noise_traces, sampling_rate)
+    return noise_spectra * _get_chain_response(amplifier_type, filter_band, samples, sampling_rate)
+
+
+@memoize(max_size=16)
+def get_noise_trace(amplifier_type, filter_band, samples, sampling_rate, temperature=noise_temperature):
+    """
+    Returns a single noise realization to add to the channel trace.
+    """
+    noise_spectrum = get_noise_spectra((), amplifier_type, filter_band, samples, sampling_rate, np.random.default_rng(seed), temperature)
+    noise_trace = fft.freq2time(noise_spectrum, sampling_rate).astype(np.float32)
+    noise_trace.flags.writeable = False
+    return noise_trace
+
+
+def apply_trigger(traces, trigger_type, threshold, noise_rms, sampling_rate):
+    """
+    Returns whether each trace triggers. The threshold trigger compares the
+    maximum absolute voltage to threshold times the noise rms, the power
+    trigger compares the maximum power integrated over
+    power_integration_window to threshold times its expectation for noise.
+    """
+    if trigger_type == 'threshold':
+        return np.max(np.abs(traces), axis=-1) > threshold * noise_rms
+    if trigger_type == 'power':
+        window = min(max(1, int(round(power_integration_window * sampling_rate))), traces.shape[-1])
+        integrated_power = np.cumsum(np.square(traces, dtype=np.float64), axis=-1)
+        integrated_power = np.concatenate((integrated_power[..., window - 1:window], integrated_power[..., window:] - integrated_power[..., :-window]), axis=-1)
+        return np.max(integrated_power, axis=-1) > threshold * window * noise_rms ** 2
+    raise ValueError('Unknown trigger type {}'.format(trigger_type))
+
+
+def count_triggers(channel_spectra, amplifier_type, filter_band, samples, sampling_rate, trigger_type, threshold, n_realizations, rng, temperature=noise_temperature):
+    """
+    Adds n_realizations noise realizations to each of the channel spectra of
+    shape (point, frequency) and returns the number of triggers per point.
+    """
+    noise_rms = get_noise_rms(amplifier_type, filter_band, samples, sampling_rate, temperature)
+    n_points = len(channel_spectra)
+    batch_size = max(1, chunk_size // (n_points * samples))
+    counts = np.zeros(n_points, dtype=int)
+    for i_start in range(0, n_realizations, batch_size):
+        noise_spectra = get_noise_spectra(
+            (n_points, min(batch_size, n_realizations - i_start)),
+            amplifier_type,
+            filter_band,
+            samples,
+            sampling_rate,
+            rng,
+            temperature
+        )
+        with metrics.timed('noise_fft'):
+            traces = fft.freq2time(channel_spectra[:, None, :] + noise_spectra, sampling_rate)
+        counts += np.sum(apply_trigger(traces, trigger_type, threshold, noise_rms, sampling_rate), axis=-1)
+    return counts
+
+
+@memoize(max_size=8)
+def get_scan_voltage_spectra(scan_parameter, parameter_items):
+    """
+    Returns the scan values and the voltage spectra of a trigger efficiency
+    scan, for the parameters given as sorted (name, value) pairs. They are
+    the same for every step of a scan, which only adds noise realizations.
+    """
+    scan_values, results = sweep.compute_sweep(scan_parameter, dict(parameter_items))
+    voltage_spectra = results['voltage_spectrum']
+    voltage_spectra.flags.writeable = False
+    return scan_values, voltage_spectra
+
+
+def run_efficiency_step(state):
+    """
+    Adds the realizations of one batched FFT to a trigger efficiency scan over
+    the range of state['scan_parameter'] and returns the updated state. Each
+    step has its own random generator, seeded from the fixed seed and the
+    number of realizations done before it.
+    """
+    parameters = dict(state['parameters'])
+    if parameters['filter_band'] is not None:
+        parameters['filter_band'] = tuple(parameters['filter_band'])
+    scan_values, voltage_spectra = get_scan_voltage_spectra(state['scan_parameter'], tuple(sorted(parameters.items())))
+    n_realizations = min(
+        max(1, chunk_size // (len(scan_values) * parameters['samples'])),
+        state['n_realizations'] - state['n_done']
+    )
+    with metrics.timed('trigger_simulation'):
+        counts = count_triggers(
+            voltage_spectra,
+            parameters['amplifier_type'],
+            parameters['filter_band'],
+            parameters['samples'],
+            parameters['sampling_rate'],
+            state['trigger_type'],
+            state['threshold'],
+            n_realizations,
+            np.random.default_rng([seed, state['n_done']])
+        )
+    if state['counts']:
+        counts += np.array(state['counts'], dtype=int)
+    return dict(
+        state,
+        scan_values=list(scan_values),
+        counts=counts.tolist(),
+        n_done=state['n_done'] + n_realizations
+    )
+
+
+def make_efficiency_figure(state):
+    scan_values = np.array(state['scan_values'])
+    n_done = max(state['n_done'], 1)
+    efficiencies = np.array(state['counts']) / n_done
+    uncertainties = np.sqrt(np.maximum(efficiencies * (1. - efficiencies), 1. / n_done) / n_done)
+    fig = go.Figure(data=[go.Scatter(
+        x=scan_values,
+        y=efficiencies,
+        error_y=dict(type='data', array=uncertainties),
+        mode='lines+markers',
+        name='efficiency'
+    )])
+    fig.add_shape(
+        type='line',
+        x0=state['parameters'][state['scan_parameter']],
+        x1=state['parameters'][state['scan_parameter']],
+        y0=0,
+        y1=1,
+        line=dict(dash='dot', color='gray')
+    )
+    fig.update_layout(
+        title='{} trigger, {} / {} realizations'.format(state['trigger_type'], state['n_done'], state['n_realizations']),
+        margin=dict(l=60, r=10, t=40, b=40)
+    )
+    fig.update_xaxes(title_text=sweep.sweep_labels[state['scan_parameter']])
+    fig.update_yaxes(title_text='trigger efficiency', range=[-.05, 1.05])
+    return fig
+
+
+def get_efficiency_update(state):
+    state = run_efficiency_step(state)
+    with metrics.timed('trigger_figure'):
+        return make_efficiency_figure(state), state
+
+
+metrics.register_cache('get_noise_rms', get_noise_rms.cache)
+metrics.register_cache('get_noise_trace', get_noise_trace.cache)
+metrics.register_cache('get_scan_voltage_spectra', get_scan_voltage_spectra.cache)
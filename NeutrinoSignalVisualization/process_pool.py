@@ -0,0 +1,27 @@
+"""
+The process pool of a server process, shared by the background jobs of the
+slow shower models and the chunks of batch simulations, so that its size is
+the one bound on the processes a server process starts. The pool is created
+on first use and spawns its workers, so that the threads of the server are
+not forked into them.
+"""
+import concurrent.futures
+import multiprocessing
+import os
+import threading
+
+max_workers = int(os.environ.get('NSV_BACKGROUND_WORKERS', min(2, os.cpu_count() or 1)))
+
+_executor = None
+_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+    return _executor
@@ -0,0 +1,119 @@
+"""
+Coalescing of callback requests per browser session. Dragging a slider fires a
+burst of requests of which only the last one is displayed, so a new request for
+a callback supersedes all earlier ones of the same session: queued requests are
+dropped, and requests that are already running are cancelled at the next call
+to check_cancelled, which the callbacks make between the stages of the signal
+chain. A stage that is running, such as an Askaryan call, is not interrupted;
+its request is only dropped once the stage returns. The work itself runs in a
+bounded worker pool, and the request thread waits for it without polling until
+it finishes or a newer request arrives.
+"""
+import collections
+import concurrent.futures
+import os
+import threading
+import uuid
+import flask
+import dash.exceptions
+import metrics
+
+session_cookie = 'nsv-session'
+# Number of (session, callback) pairs whose latest request is remembered
+max_generations = 10000
+
+
+class StaleRequest(Exception):
+    pass
+
+
+def get_session_id():
+    session_id = flask.request.cookies.get(session_cookie)
+    if session_id is None:
+        session_id = flask.request.remote_addr
+    return session_id
+
+
+def init_app(server):
+    @server.after_request
+    def set_session_cookie(response):
+        if session_cookie not in flask.request.cookies:
+            response.set_cookie(session_cookie, uuid.uuid4().hex, httponly=True, samesite='Lax')
+        return response
+
+
+class RequestCoalescer(object):
+    def __init__(self, max_workers=None):
+        if max_workers is None:
+            max_workers = int(os.environ.get('NSV_WORKERS', min(4, os.cpu_count() or 1)))
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers, thread_name_prefix='signal-worker')
+        # (session, callback) -> (generation, event set when the request finishes or is superseded)
+        self._generations = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.superseded = 0
+        self.cancelled = 0
+
+    def _is_stale(self, key, generation):
+        latest = self._generations.get(key)
+        return latest is None or latest[0] != generation
+
+    def _execute(self, key, generation, function, args):
+        if self._is_stale(key, generation):
+            raise StaleRequest()
+        self._local.request = (key, generation)
+        try:
+            return metrics.profile_call(function, *args)
+        finally:
+            self._local.request = None
+
+    def check_cancelled(self):
+        """
+        Raises StaleRequest if the request executed by the current worker has
+        been superseded by a newer one.
+        """
+        request = getattr(self._local, 'request', None)
+        if request is not None and self._is_stale(*request):
+            raise StaleRequest()
+
+    def run(self, name, function, *args):
+        """
+        Runs function(*args) in the worker pool and returns its result, or
+        raises PreventUpdate if the request is superseded before it finishes.
+        A superseded request returns at once, but its work keeps running in
+        the pool until the next call to check_cancelled.
+        """
+        key = (get_session_id(), name)
+        wake = threading.Event()
+        with self._lock:
+            previous_generation, previous_wake = self._generations.pop(key, (0, None))
+            if previous_wake is not None:
+                previous_wake.set()
+            generation = previous_generation + 1
+            self._generations[key] = (generation, wake)
+            while len(self._generations) > max_generations:
+                self._generations.popitem(last=False)
+        future = self._executor.submit(self._execute, key, generation, function, args)
+        future.add_done_callback(lambda future: wake.set())
+        wake.wait()
+        if not future.done():
+            future.cancel()
+            with self._lock:
+                self.superseded += 1
+            raise dash.exceptions.PreventUpdate()
+        try:
+            result = future.result()
+        except StaleRequest:
+            with self._lock:
+                self.cancelled += 1
+            raise dash.exceptions.PreventUpdate()
+        if self._is_stale(key, generation):
+            with self._lock:
+                self.superseded += 1
+            raise dash.exceptions.PreventUpdate()
+        return result
+
+
+coalescer = RequestCoalescer()
+metrics.register_counter('nsv_requests_superseded_total', 'Callback requests dropped because a newer one arrived.', lambda: coalescer.superseded)
+metrics.register_counter('nsv_requests_cancelled_total', 'Running callback requests cancelled between stages.', lambda: coalescer.cancelled)
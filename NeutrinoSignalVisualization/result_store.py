@@ -0,0 +1,38 @@
+import hashlib
+import json
+from cache import LRUCache
+import metrics
+
+
+class ResultStore(object):
+    """
+    Keeps computed results (dicts of numpy arrays) on the server, so that only
+    a short key has to be sent to the browser and passed between callbacks.
+    Keys are derived from the parameters a result was computed from, so that
+    a result that has been evicted can be recomputed from its key's parameters.
+    """
+    def __init__(self, max_size=256):
+        self._cache = LRUCache(max_size)
+
+    @staticmethod
+    def make_key(kind, parameters):
+        digest = hashlib.sha1(json.dumps([kind, parameters]).encode()).hexdigest()
+        return '{}-{}'.format(kind, digest[:16])
+
+    def put(self, kind, parameters, result):
+        key = self.make_key(kind, parameters)
+        self._cache.put(key, result)
+        return key
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def clear(self):
+        self._cache.clear()
+
+    def get_stats(self):
+        return self._cache.get_stats()
+
+
+result_store = ResultStore()
+metrics.register_cache('result_store', result_store)
@@ -0,0 +1,229 @@
+"""
+The signal chain shown in the app, split into stages:
+emission -> propagation -> polarization -> antenna -> amplifier -> filter.
+Each stage is memoized on its own inputs and those of the stages upstream of
+it, so changing a parameter only re-executes the stages downstream of it.
+The polarization only weights the theta and phi components by the cosine and
+sine of the polarization angle, so the app computes both components and
+leaves the weighting to the browser.
+All stages take the trace length and sampling rate as their last arguments.
+Arrays returned by the stages are shared between callers and read-only, and
+traces and spectra are kept in single precision.
+"""
+import numpy as np
+from NuRadioReco.utilities import units, fft
+import emission
+import antenna_response
+import detector_response
+import ice_attenuation
+from cache import memoize
+import metrics
+
+default_samples = 512
+default_sampling_rate = 1. * units.GHz
+# Choices of the trace length and sampling rate (in GHz) dropdowns
+sample_counts = [512, 1024, 2048, 4096, 8192, 16384, 32768, 65536]
+sampling_rates = [1., 2., 3.2, 5.]
+ior = 1.78
+distance = 1. * units.km
+
+# Maximum number of samples (directions x samples) per inverse FFT of the sky map
+sky_map_chunk_size = 2 ** 22
+
+
+def _freeze(*arrays):
+    for array in arrays:
+        array.flags.writeable = False
+    if len(arrays) == 1:
+        return arrays[0]
+    return arrays
+
+
+def _freeze_single(*arrays):
+    """
+    Converts the arrays to float32 or complex64 and makes them read-only.
+    """
+    single_arrays = []
+    for array in arrays:
+        if np.iscomplexobj(array):
+            single_arrays.append(np.asarray(array).astype(np.complex64, copy=False))
+        else:
+            single_arrays.append(np.asarray(array).astype(np.float32, copy=False))
+    return _freeze(*single_arrays)
+
+
+@memoize(max_size=8)
+def get_frequencies(samples, sampling_rate):
+    return _freeze(np.fft.rfftfreq(samples, 1. / sampling_rate))
+
+
+@memoize(max_size=8)
+def get_times(samples, sampling_rate):
+    return _freeze(np.arange(samples) / sampling_rate)
+
+
+def get_emission_arguments(log_energy, viewing_angle, shower_type, model, samples, sampling_rate):
+    """
+    Returns the arguments of emission.get_shower_spectrum for the parameters
+    of get_emission_spectrum.
+    """
+    return (
+        np.power(10., log_energy),
+        np.arccos(1. / ior) + viewing_angle * units.deg,
+        samples,
+        1. / sampling_rate,
+        shower_type,
+        ior,
+        distance,
+        model
+    )
+
+
+@memoize(max_size=64)
+def get_emission_spectrum(log_energy, viewing_angle, shower_type, model, samples, sampling_rate):
+    return _freeze_single(emission.get_shower_spectrum(
+        *get_emission_arguments(log_energy, viewing_angle, shower_type, model, samples, sampling_rate)
+    ))
+
+
+def get_attenuation_factor(attenuation_model, propagation_length, depth, path_zenith, samples, sampling_rate):
+    """
+    Returns the attenuation factor per frequency for a propagation length in
+    km and a depth in m. If path_zenith (in degrees) is not None, the
+    attenuation follows the depth along the path towards path_zenith.
+    """
+    return ice_attenuation.get_attenuation_factor(
+        attenuation_model,
+        propagation_length * units.km,
+        depth * units.m,
+        None if path_zenith is None else path_zenith * units.deg,
+        samples,
+        sampling_rate
+    )
+
+
+@memoize(max_size=128)
+def get_propagated_efield(log_energy, viewing_angle, shower_type, model, propagation_length, attenuation_model, depth, path_zenith, samples, sampling_rate):
+    """
+    Returns the spectrum and trace of the electric field after propagation,
+    before it is split into its polarization components.
+    """
+    efield_spectrum = get_emission_spectrum(log_energy, viewing_angle, shower_type, model, samples, sampling_rate)
+    if propagation_length > 0:
+        with metrics.timed('attenuation'):
+            efield_spectrum = efield_spectrum * get_attenuation_factor(attenuation_model, propagation_length, depth, path_zenith, samples, sampling_rate)
+    with metrics.timed('efield_fft'):
+        efield_trace = fft.freq2time(efield_spectrum, sampling_rate)
+    return _freeze_single(efield_spectrum, efield_trace)
+
+
+def get_efield(efield_parameters):
+    """
+    Returns the propagated electric field for the parameters of
+    get_propagated_efield as a dict, in the form kept in the result store.
+    """
+    efield_spectrum, efield_trace = get_propagated_efield(*efield_parameters)
+    return {
+        'spectrum': efield_spectrum,
+        'trace': efield_trace,
+        'samples': efield_parameters[-2],
+        'sampling_rate': efield_parameters[-1]
+    }
+
+
+@memoize(max_size=512)
+def get_antenna_response(antenna_type, zenith, azimuth, samples, sampling_rate):
+    antenna_response_theta, antenna_response_phi = antenna_response.get_antenna_response(
+        antenna_type,
+        zenith,
+        azimuth,
+        samples,
+        sampling_rate
+    )
+    return _freeze_single(antenna_response_theta, antenna_response_phi)
+
+
+@memoize(max_size=256)
+def get_detector_response(antenna_type, zenith, azimuth, amplifier_type, filter_band, samples, sampling_rate):
+    antenna_response_theta, antenna_response_phi = get_antenna_response(antenna_type, zenith, azimuth, samples, sampling_rate)
+    chain_response = detector_response.get_detector_chain_response(amplifier_type, filter_band, samples, sampling_rate)
+    return _freeze_single(antenna_response_theta * chain_response, antenna_response_phi * chain_response)
+
+
+def get_channel_voltage_components(efield_spectrum, antenna_type, zenith, azimuth, amplifier_type, filter_band, samples, sampling_rate):
+    """
+    Returns the channel spectra and traces, each of shape (2, ...), for the
+    electric field polarized purely along theta and purely along phi. The
+    voltage for a polarization angle alpha is cos(alpha) times the first plus
+    sin(alpha) times the second.
+    """
+    detector_responses = np.stack(get_detector_response(antenna_type, zenith, azimuth, amplifier_type, filter_band, samples, sampling_rate))
+    channel_spectra = detector_responses * efield_spectrum
+    with metrics.timed('channel_fft'):
+        channel_traces = fft.freq2time(channel_spectra, sampling_rate)
+    return _freeze_single(channel_spectra, channel_traces)
+
+
+@memoize(max_size=32)
+def get_effective_length_map(antenna_type, amplifier_type, filter_band, band, samples, sampling_rate):
+    """
+    Returns the magnitude of the effective length, including the amplifier and
+    filter, averaged over the given frequency band for all directions of the
+    antenna response table, as an array of shape (zenith, azimuth).
+    """
+    table = antenna_response.get_response_table(antenna_type, samples, sampling_rate)
+    table_freqs = antenna_response.get_table_frequencies(samples, sampling_rate)
+    chain_response = np.interp(
+        table_freqs,
+        get_frequencies(samples, sampling_rate),
+        np.abs(detector_response.get_detector_chain_response(amplifier_type, filter_band, samples, sampling_rate))
+    )
+    mask = (table_freqs >= band[0]) & (table_freqs <= band[1])
+    if not np.any(mask):
+        mask[np.argmin(np.abs(table_freqs - band[0]))] = True
+    effective_length = np.sqrt(np.sum(np.abs(table[:, :, mask]) ** 2, axis=-1)) * chain_response[mask]
+    return _freeze_single(np.mean(effective_length, axis=-1))
+
+
+@memoize(max_size=32)
+def get_peak_voltage_map(efield_parameters, polarization_angle, antenna_type, amplifier_type, filter_band):
+    """
+    Returns the maximum absolute voltage for the electric field given by the
+    parameters of get_propagated_efield and the polarization angle, arriving
+    from each direction of the antenna response table, as an array of shape
+    (zenith, azimuth).
+    """
+    efield_spectrum, efield_trace = get_propagated_efield(*efield_parameters)
+    samples, sampling_rate = efield_parameters[-2:]
+    efield_spectrum_theta = efield_spectrum * np.float32(np.cos(polarization_angle * units.deg))
+    efield_spectrum_phi = efield_spectrum * np.float32(np.sin(polarization_angle * units.deg))
+    chain_response = detector_response.get_detector_chain_response(amplifier_type, filter_band, samples, sampling_rate)
+    zeniths, azimuths = np.meshgrid(antenna_response.zenith_grid, antenna_response.azimuth_grid, indexing='ij')
+    zeniths = zeniths.flatten()
+    azimuths = azimuths.flatten()
+    peak_voltages = np.zeros(len(zeniths), dtype=np.float32)
+    chunk_size = max(1, sky_map_chunk_size // samples)
+    for i_start in range(0, len(zeniths), chunk_size):
+        responses = antenna_response.interpolate_antenna_responses(
+            antenna_type,
+            zeniths[i_start:i_start + chunk_size],
+            azimuths[i_start:i_start + chunk_size],
+            samples,
+            sampling_rate
+        )
+        channel_spectra = (responses[..., 0] * efield_spectrum_theta + responses[..., 1] * efield_spectrum_phi) * chain_response
+        with metrics.timed('sky_map_fft'):
+            channel_traces = fft.freq2time(channel_spectra, sampling_rate)
+        peak_voltages[i_start:i_start + chunk_size] = np.max(np.abs(channel_traces), axis=-1)
+    return _freeze(peak_voltages.reshape((len(antenna_response.zenith_grid), len(antenna_response.azimuth_grid))))
+
+
+for stage in [
+    get_emission_spectrum,
+    get_propagated_efield,
+    get_antenna_response,
+    get_detector_response,
+    get_effective_length_map,
+    get_peak_voltage_map
+]:
+    metrics.register_cache(stage.__name__, stage.cache)
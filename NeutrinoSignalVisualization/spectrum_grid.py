@@ -0,0 +1,126 @@
+import argparse
+import json
+import multiprocessing
+import os
+import numpy as np
+from NuRadioReco.utilities import units
+
+log_energies = np.arange(16., 20.01, .25)
+viewing_angles = np.arange(-10., 10.01, 1.)
+shower_types = ['HAD', 'EM']
+models = ['ARZ2020', 'ARZ2019', 'Alvarez2009', 'Alvarez2000', 'ZHS1992']
+samples = 512
+sampling_rate = 1. * units.GHz
+ior = 1.78
+distance = 1. * units.km
+
+default_filename = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'spectrum_grid.npy')
+
+_grid = None
+_grid_loaded = False
+
+
+def get_metadata_filename(filename):
+    return os.path.splitext(filename)[0] + '.json'
+
+
+def _compute_grid_point(indices):
+    import emission
+    i_model, i_shower, i_energy, i_angle = indices
+    cherenkov_angle = np.arccos(1. / ior)
+    spectrum = emission.compute_shower_spectrum(
+        np.power(10., log_energies[i_energy]),
+        cherenkov_angle + viewing_angles[i_angle] * units.deg,
+        samples,
+        1. / sampling_rate,
+        shower_types[i_shower],
+        ior,
+        distance,
+        models[i_model]
+    )
+    return indices, spectrum
+
+
+def build_grid(filename=default_filename, processes=None):
+    shape = (len(models), len(shower_types), len(log_energies), len(viewing_angles), samples // 2 + 1)
+    # Stored in the single precision of the signal chain, so that lookups are views of the file
+    grid = np.lib.format.open_memmap(filename, mode='w+', dtype=np.complex64, shape=shape)
+    tasks = list(np.ndindex(*shape[:-1]))
+    with multiprocessing.Pool(processes) as pool:
+        for i_task, (indices, spectrum) in enumerate(pool.imap_unordered(_compute_grid_point, tasks, chunksize=4)):
+            grid[indices] = spectrum
+            if (i_task + 1) % 100 == 0 or i_task + 1 == len(tasks):
+                print('{}/{} spectra computed'.format(i_task + 1, len(tasks)))
+    grid.flush()
+    del grid
+    with open(get_metadata_filename(filename), 'w') as f:
+        json.dump({
+            'log_energies': log_energies.tolist(),
+            'viewing_angles': viewing_angles.tolist(),
+            'shower_types': shower_types,
+            'models': models,
+            'samples': samples,
+            'sampling_rate': sampling_rate,
+            'ior': ior,
+            'distance': distance
+        }, f)
+
+
+def load_grid(filename=None):
+    """
+    Opens the precomputed spectrum grid as a read-only memory map.
+    Returns None if the grid has not been built.
+    """
+    if filename is None:
+        filename = os.environ.get('SPECTRUM_GRID_FILE', default_filename)
+    if not os.path.isfile(filename) or not os.path.isfile(get_metadata_filename(filename)):
+        return None
+    with open(get_metadata_filename(filename), 'r') as f:
+        metadata = json.load(f)
+    metadata['spectra'] = np.load(filename, mmap_mode='r')
+    metadata['log_energies'] = np.array(metadata['log_energies'])
+    metadata['viewing_angles'] = np.array(metadata['viewing_angles'])
+    return metadata
+
+
+def get_grid():
+    global _grid, _grid_loaded
+    if not _grid_loaded:
+        _grid = load_grid()
+        _grid_loaded = True
+    return _grid
+
+
+def _find_index(values, value):
+    index = np.searchsorted(values, value - 1.e-6)
+    if index < len(values) and abs(values[index] - value) < 1.e-6:
+        return int(index)
+    return None
+
+
+def lookup(energy, viewing_angle, samples, dt, shower_type, ior, distance, model):
+    """
+    Returns a zero-copy view of the grid spectrum for the given parameters,
+    or None if they do not fall on a grid point.
+    """
+    grid = get_grid()
+    if grid is None:
+        return None
+    if samples != grid['samples'] or not np.isclose(1. / dt, grid['sampling_rate']) \
+            or not np.isclose(ior, grid['ior']) or not np.isclose(distance, grid['distance']):
+        return None
+    if model not in grid['models'] or shower_type not in grid['shower_types']:
+        return None
+    i_energy = _find_index(grid['log_energies'], np.log10(energy))
+    i_angle = _find_index(grid['viewing_angles'], (viewing_angle - np.arccos(1. / ior)) / units.deg)
+    if i_energy is None or i_angle is None:
+        return None
+    return grid['spectra'][grid['models'].index(model), grid['shower_types'].index(shower_type), i_energy, i_angle]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Precompute the Askaryan spectra for all slider settings.')
+    parser.add_argument('--output', default=default_filename, help='path of the .npy file to write')
+    parser.add_argument('--processes', type=int, default=None, help='number of worker processes (default: all cores)')
+    args = parser.parse_args()
+    build_grid(args.output, args.processes)
@@ -0,0 +1,81 @@
+"""
+Startup bookkeeping: timing of the startup phases, a background thread that
+warms up the antenna patterns and amplifier responses once the server is
+up, and a readiness endpoint that reports both.
+"""
+import contextlib
+import threading
+import time
+import flask
+
+process_start = time.time()
+phase_timings = {}
+warm_up_errors = {}
+_ready = threading.Event()
+_warm_up_thread = None
+_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def timed_phase(name):
+    start = time.time()
+    try:
+        yield
+    finally:
+        phase_timings[name] = time.time() - start
+
+
+def mark_phase(name):
+    """
+    Records the time elapsed since the process started under the given name.
+    """
+    phase_timings[name] = time.time() - process_start
+
+
+def warm_up():
+    import antenna_response
+    import detector_response
+    import signal_chain
+    with timed_phase('warm_up_imports'):
+        import NuRadioMC.SignalGen.askaryan
+        import NuRadioMC.utilities.attenuation
+        import scipy.signal
+    with timed_phase('warm_up_antenna_patterns'):
+        for antenna_type in antenna_response.antenna_types:
+            try:
+                antenna_response.get_response_table(antenna_type, signal_chain.default_samples, signal_chain.default_sampling_rate)
+            except Exception as e:
+                warm_up_errors[antenna_type] = repr(e)
+    with timed_phase('warm_up_amplifiers'):
+        for amplifier_type in detector_response.amplifier_types:
+            try:
+                detector_response.get_amplifier_response(amplifier_type, signal_chain.default_samples, signal_chain.default_sampling_rate)
+            except Exception as e:
+                warm_up_errors[str(amplifier_type)] = repr(e)
+    mark_phase('ready')
+    _ready.set()
+
+
+def start_warm_up():
+    global _warm_up_thread
+    with _lock:
+        if _warm_up_thread is None:
+            _warm_up_thread = threading.Thread(target=warm_up, name='warm-up', daemon=True)
+            _warm_up_thread.start()
+
+
+def is_ready():
+    return _ready.is_set()
+
+
+def init_app(server):
+    @server.route('/ready')
+    def ready():
+        response = flask.jsonify({
+            'ready': is_ready(),
+            'uptime': time.time() - process_start,
+            'phases': phase_timings,
+            'errors': warm_up_errors
+        })
+        response.status_code = 200 if is_ready() else 503
+        return response
@@ -0,0 +1,141 @@
+"""
+Multi-channel station mode. Each channel has its own antenna type,
+orientation, rotation, amplifier and cable delay. The voltages of all channels
+are computed in one pass: the signal direction and polarization are rotated
+into every antenna frame at once, the antenna responses are interpolated per
+group of identical antennas, the amplifier and filter are applied per group of
+identical hardware and a single 2-D inverse FFT gives all channel traces.
+Angles are given in degrees and cable delays in ns.
+"""
+import numpy as np
+from NuRadioReco.utilities import units, fft
+import antenna_response
+import detector_response
+import signal_chain
+import metrics
+
+
+def _make_channel(channel_id, antenna_type, orientation_theta, orientation_phi, rotation_theta, rotation_phi, amplifier_type, cable_delay=0.):
+    return {
+        'channel_id': channel_id,
+        'antenna_type': antenna_type,
+        'orientation_theta': orientation_theta,
+        'orientation_phi': orientation_phi,
+        'rotation_theta': rotation_theta,
+        'rotation_phi': rotation_phi,
+        'amplifier_type': amplifier_type,
+        'cable_delay': cable_delay
+    }
+
+
+def _make_rno_g_station():
+    vpol = 'greenland_vpol_InfFirn'
+    hpol = 'fourslot_InfFirn'
+    lpda = 'createLPDA_100MHz_InfFirn'
+    deep_channels = [
+        (0, vpol), (1, vpol), (2, vpol), (3, vpol), (4, hpol), (5, vpol), (6, vpol), (7, vpol), (8, hpol),
+        (9, vpol), (10, vpol), (11, hpol), (21, vpol), (22, vpol), (23, hpol)
+    ]
+    channels = [_make_channel(channel_id, antenna_type, 0., 0., 90., 0., 'iglu') for channel_id, antenna_type in deep_channels]
+    for i_lpda, channel_id in enumerate(range(12, 21)):
+        azimuth = 120. * (i_lpda // 3)
+        if i_lpda % 3 == 1:
+            channels.append(_make_channel(channel_id, lpda, 0., 0., 90., azimuth, 'rno_surface'))
+        else:
+            channels.append(_make_channel(channel_id, lpda, 180., 0., 90., azimuth + 90. * (i_lpda % 3 // 2), 'rno_surface'))
+    return sorted(channels, key=lambda channel: channel['channel_id'])
+
+
+# Channel layout of an RNO-G station. Cable delays depend on the individual
+# station and are left at zero.
+rno_g_station = _make_rno_g_station()
+
+
+def _get_unit_vectors(theta, phi):
+    return np.stack((np.sin(theta) * np.cos(phi), np.sin(theta) * np.sin(phi), np.cos(theta)), axis=-1)
+
+
+def _get_spherical_basis(zenith, azimuth):
+    """
+    Returns the unit vectors e_theta and e_phi for the given directions.
+    """
+    e_theta = np.stack((np.cos(zenith) * np.cos(azimuth), np.cos(zenith) * np.sin(azimuth), -np.sin(zenith)), axis=-1)
+    e_phi = np.stack((-np.sin(azimuth), np.cos(azimuth), np.zeros_like(azimuth)), axis=-1)
+    return e_theta, e_phi
+
+
+def get_local_directions(channels, zenith, azimuth):
+    """
+    Transforms the signal direction into the frames of all antennas.
+    Returns the local zenith and azimuth angles in degrees and the 2x2
+    matrices (channel, global {theta, phi}, local {theta, phi}) that project
+    the electric field onto the local polarization components.
+    """
+    orientations = _get_unit_vectors(
+        np.array([channel['orientation_theta'] for channel in channels]) * units.deg,
+        np.array([channel['orientation_phi'] for channel in channels]) * units.deg
+    )
+    rotations = _get_unit_vectors(
+        np.array([channel['rotation_theta'] for channel in channels]) * units.deg,
+        np.array([channel['rotation_phi'] for channel in channels]) * units.deg
+    )
+    rotations = rotations - np.sum(rotations * orientations, axis=-1)[:, None] * orientations
+    rotations /= np.linalg.norm(rotations, axis=-1)[:, None]
+    third_axes = np.cross(orientations, rotations)
+
+    zenith = zenith * units.deg
+    azimuth = azimuth * units.deg
+    signal_direction = _get_unit_vectors(zenith, azimuth)
+    e_theta, e_phi = _get_spherical_basis(zenith, azimuth)
+    local_zeniths = np.arccos(np.clip(np.dot(orientations, signal_direction), -1., 1.))
+    local_azimuths = np.mod(np.arctan2(np.dot(third_axes, signal_direction), np.dot(rotations, signal_direction)), 2. * np.pi)
+    local_e_theta = np.cos(local_zeniths)[:, None] * (np.cos(local_azimuths)[:, None] * rotations + np.sin(local_azimuths)[:, None] * third_axes) \
+        - np.sin(local_zeniths)[:, None] * orientations
+    local_e_phi = -np.sin(local_azimuths)[:, None] * rotations + np.cos(local_azimuths)[:, None] * third_axes
+    projections = np.stack((
+        np.stack((np.dot(local_e_theta, e_theta), np.dot(local_e_phi, e_theta)), axis=-1),
+        np.stack((np.dot(local_e_theta, e_phi), np.dot(local_e_phi, e_phi)), axis=-1)
+    ), axis=1)
+    return local_zeniths / units.deg, local_azimuths / units.deg, projections
+
+
+def _group_channels(channels, key):
+    groups = {}
+    for i_channel, channel in enumerate(channels):
+        groups.setdefault(key(channel), []).append(i_channel)
+    return groups
+
+
+def get_station_voltages(efield_spectrum_theta, efield_spectrum_phi, channels, zenith, azimuth, filter_band, samples, sampling_rate):
+    """
+    Returns the spectra and traces of all channels, both of shape
+    (channel, frequency / sample).
+    """
+    freqs = signal_chain.get_frequencies(samples, sampling_rate)
+    local_zeniths, local_azimuths, projections = get_local_directions(channels, zenith, azimuth)
+    efield_spectra = np.stack((efield_spectrum_theta, efield_spectrum_phi))
+    local_efield_spectra = np.einsum('cgl,gf->clf', projections, efield_spectra)
+
+    antenna_responses = np.zeros((len(channels), len(freqs), 2), dtype=np.complex64)
+    with metrics.timed('station_antenna_response'):
+        for antenna_type, indices in _group_channels(channels, lambda channel: channel['antenna_type']).items():
+            antenna_responses[indices] = antenna_response.interpolate_antenna_responses(
+                antenna_type,
+                local_zeniths[indices],
+                local_azimuths[indices],
+                samples,
+                sampling_rate
+            )
+    channel_spectra = antenna_responses[:, :, 0] * local_efield_spectra[:, 0] + antenna_responses[:, :, 1] * local_efield_spectra[:, 1]
+    for amplifier_type, indices in _group_channels(channels, lambda channel: channel['amplifier_type']).items():
+        channel_spectra[indices] *= detector_response.get_detector_chain_response(
+            amplifier_type,
+            filter_band,
+            samples,
+            sampling_rate
+        )
+    cable_delays = np.array([channel['cable_delay'] for channel in channels]) * units.ns
+    channel_spectra *= np.exp(-2.j * np.pi * cable_delays[:, None] * freqs[None, :]).astype(np.complex64)
+    with metrics.timed('station_fft'):
+        channel_traces = fft.freq2time(channel_spectra, sampling_rate)
+    return channel_spectra, channel_traces
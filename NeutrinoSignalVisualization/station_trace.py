@@ -0,0 +1,166 @@
+from dash.dependencies import Input, Output
+import dash_core_components as dcc
+import dash_html_components as html
+import plotly.graph_objs as go
+import numpy as np
+import json
+from NuRadioReco.utilities import units
+from app import app
+import signal_chain
+from downsampling import downsample
+import station
+from result_store import result_store
+from request_coalescing import coalescer
+import metrics
+
+layout = html.Div([
+    html.Div([
+        html.Div([
+            html.Div('Station', className='panel-heading'),
+            html.Div([
+                dcc.Checklist(
+                    id='station-mode-checklist',
+                    options=[
+                        {'label': 'Station Mode', 'value': 'station'}
+                    ],
+                    value=[]
+                ),
+                html.Div('Channels'),
+                dcc.Textarea(
+                    id='station-channels-textarea',
+                    value=json.dumps(station.rno_g_station, indent=1),
+                    style={'width': '100%', 'height': '300px', 'font-family': 'monospace'}
+                ),
+                html.Div(id='station-channels-error', style={'color': 'red'})
+            ], className='panel-body')
+        ], className='panel panel-default')
+    ], style={'flex': '1'}),
+    html.Div([
+        html.Div([
+            html.Div('Station Voltages', className='panel-heading'),
+            html.Div([
+                dcc.Graph(id='station-plot')
+            ], className='panel-body')
+        ], className='panel panel-default')
+    ], style={'flex': '4'})
+], style={'display': 'flex'})
+
+channel_keys = ['channel_id', 'antenna_type', 'orientation_theta', 'orientation_phi', 'rotation_theta', 'rotation_phi', 'amplifier_type']
+
+
+def parse_channels(channels_json):
+    channels = json.loads(channels_json)
+    if not isinstance(channels, list) or len(channels) == 0:
+        raise ValueError('The channels have to be a non-empty list.')
+    for channel in channels:
+        missing_keys = [key for key in channel_keys if key not in channel]
+        if len(missing_keys) > 0:
+            raise ValueError('Channel {} is missing {}'.format(channel.get('channel_id'), ', '.join(missing_keys)))
+        channel.setdefault('cable_delay', 0.)
+    return channels
+
+
+@app.callback(
+    [Output('station-plot', 'figure'),
+    Output('station-channels-error', 'children')],
+    [Input('station-mode-checklist', 'value'),
+    Input('efield-trace-storage', 'children'),
+    Input('station-channels-textarea', 'value'),
+    Input('signal-zenith-slider', 'value'),
+    Input('signal-azimuth-slider', 'value'),
+    Input('filter-toggle-checklist', 'value'),
+    Input('filter-band-range-slider', 'value'),
+    Input('polarization-angle-slider', 'value')]
+)
+def update_station_plot(
+    station_mode,
+    electric_field,
+    channels_json,
+    signal_zenith,
+    signal_azimuth,
+    filter_toggle,
+    filter_band,
+    polarization_angle
+):
+    if 'station' not in station_mode:
+        return {}, ''
+    try:
+        channels = parse_channels(channels_json)
+    except (ValueError, AttributeError, TypeError) as e:
+        return {}, str(e)
+    return coalescer.run(
+        'station',
+        build_station_plot,
+        electric_field,
+        channels,
+        signal_zenith,
+        signal_azimuth,
+        filter_toggle,
+        filter_band,
+        polarization_angle
+    )
+
+
+def build_station_plot(
+    electric_field,
+    channels,
+    signal_zenith,
+    signal_azimuth,
+    filter_toggle,
+    filter_band,
+    polarization_angle
+):
+    efield_reference = json.loads(electric_field)
+    if efield_reference is None:
+        return {}, ''
+    efield = result_store.get(efield_reference['key'])
+    if efield is None:
+        efield = signal_chain.get_efield(efield_reference['parameters'])
+        coalescer.check_cancelled()
+    if 'filter' in filter_toggle:
+        filter_band = tuple(filter_band)
+    else:
+        filter_band = None
+    with metrics.timed('station_voltages'):
+        channel_spectra, channel_traces = station.get_station_voltages(
+            efield['spectrum'] * np.float32(np.cos(polarization_angle * units.deg)),
+            efield['spectrum'] * np.float32(np.sin(polarization_angle * units.deg)),
+            channels,
+            signal_zenith,
+            signal_azimuth,
+            filter_band,
+            efield['samples'],
+            efield['sampling_rate']
+        )
+    with metrics.timed('station_figure'):
+        return make_station_figure(channels, channel_traces, efield['samples'], efield['sampling_rate']), ''
+
+
+def make_station_figure(channels, channel_traces, samples, sampling_rate):
+    times = signal_chain.get_times(samples, sampling_rate)
+    offset = 2. * np.max(np.abs(channel_traces)) / units.mV
+    if offset == 0:
+        offset = 1.
+    data = []
+    for i_channel, channel in enumerate(channels):
+        x, y = downsample(times/units.ns, channel_traces[i_channel]/units.mV + i_channel * offset)
+        data.append(go.Scatter(
+            x=x,
+            y=y,
+            name='Ch. {}'.format(channel['channel_id']),
+            line=dict(width=1)
+        ))
+    fig = go.Figure(data=data)
+    fig.update_layout(
+        height=max(400, 40 * len(channels)),
+        showlegend=False,
+        margin=dict(l=60, r=10, t=10, b=40)
+    )
+    fig.update_xaxes(title_text='t [ns]')
+    fig.update_yaxes(
+        title_text='U [mV] + offset',
+        tickmode='array',
+        tickvals=[i_channel * offset for i_channel in range(len(channels))],
+        ticktext=['Ch. {}'.format(channel['channel_id']) for channel in channels]
+    )
+    return fig
@@ -0,0 +1,129 @@
+"""
+Parameter sweeps: all frames of a sweep over the range of one slider are
+computed in one batched job and sent to the browser as a single Plotly
+animation, so that playback needs no further requests.
+"""
+import numpy as np
+import plotly.subplots
+import plotly.graph_objs as go
+from NuRadioReco.utilities import units
+import batch
+import background_jobs
+from downsampling import downsample
+import metrics
+
+sweep_ranges = {
+    'log_energy': np.arange(16., 20.01, .25),
+    'viewing_angle': np.arange(-10., 10.01, 1.),
+    'propagation_length': np.arange(0., 5.01, .1)
+}
+sweep_labels = {
+    'log_energy': 'log10(E/eV)',
+    'viewing_angle': 'viewing angle [deg]',
+    'propagation_length': 'propagation length [km]'
+}
+
+
+def prefetch_emission_spectra(emission_parameters):
+    """
+    Computes the emission spectra of slow models that are neither cached nor
+    on the precomputed grid in the background pool at the same time, and puts
+    them into the emission cache. Fast models are computed by the sweep.
+    """
+    background_jobs.compute_concurrently(list(set(emission_parameters)))
+
+
+def compute_sweep(sweep_parameter, parameters):
+    """
+    Runs the signal chain for all values of sweep_parameter, with all other
+    parameters (as in batch.default_parameters) fixed.
+    """
+    sweep_values = sweep_ranges[sweep_parameter]
+    parameter_sets = batch.make_parameter_sets(dict(parameters, **{sweep_parameter: list(sweep_values)}))
+    samples = int(parameter_sets['samples'][0])
+    sampling_rate = float(parameter_sets['sampling_rate'][0])
+    prefetch_emission_spectra([
+        emission_parameters + (samples, sampling_rate)
+        for emission_parameters in zip(
+            parameter_sets['log_energy'],
+            parameter_sets['viewing_angle'],
+            parameter_sets['shower_type'],
+            parameter_sets['model']
+        )
+    ])
+    return sweep_values, batch.simulate_batch(parameter_sets)
+
+
+def _get_range(values):
+    maximum = np.max(np.abs(values))
+    if maximum == 0:
+        maximum = 1.
+    return [-1.1 * maximum, 1.1 * maximum]
+
+
+def make_sweep_figure(sweep_parameter, sweep_values, results):
+    times = results['times'] / units.ns
+    efield_theta = results['efield_trace_theta'] / (units.mV / units.m)
+    efield_phi = results['efield_trace_phi'] / (units.mV / units.m)
+    voltage = results['voltage_trace'] / units.mV
+
+    def make_trace(y, name):
+        x, y = downsample(times, y)
+        return go.Scatter(x=x, y=y, name=name)
+
+    def make_traces(i_frame):
+        return [
+            make_trace(efield_theta[i_frame], 'E_theta (t)'),
+            make_trace(efield_phi[i_frame], 'E_phi (t)'),
+            make_trace(voltage[i_frame], 'U (t)')
+        ]
+
+    fig = plotly.subplots.make_subplots(rows=1, cols=2,
+        shared_xaxes=False, shared_yaxes=False,
+        vertical_spacing=0.01, subplot_titles=['Electric Field', 'Voltage'])
+    initial_traces = make_traces(0)
+    fig.append_trace(initial_traces[0], 1, 1)
+    fig.append_trace(initial_traces[1], 1, 1)
+    fig.append_trace(initial_traces[2], 1, 2)
+    frame_names = ['{:.2f}'.format(value) for value in sweep_values]
+    fig.frames = [
+        go.Frame(data=make_traces(i_frame), traces=[0, 1, 2], name=frame_name)
+        for i_frame, frame_name in enumerate(frame_names)
+    ]
+    fig.update_xaxes(title_text='t [ns]', row=1, col=1)
+    fig.update_xaxes(title_text='t [ns]', row=1, col=2)
+    fig.update_yaxes(title_text='E [mV/m]', range=_get_range(np.concatenate((efield_theta, efield_phi))), row=1, col=1)
+    fig.update_yaxes(title_text='U [mV]', range=_get_range(voltage), row=1, col=2)
+    animation_settings = dict(frame=dict(duration=100, redraw=False), mode='immediate', transition=dict(duration=0))
+    fig.update_layout(
+        updatemenus=[dict(
+            type='buttons',
+            showactive=False,
+            x=0,
+            y=-.15,
+            xanchor='left',
+            buttons=[
+                dict(label='Play', method='animate', args=[None, dict(animation_settings, fromcurrent=True)]),
+                dict(label='Pause', method='animate', args=[[None], dict(animation_settings, mode='immediate')])
+            ]
+        )],
+        sliders=[dict(
+            x=.15,
+            y=-.1,
+            len=.85,
+            currentvalue=dict(prefix=sweep_labels[sweep_parameter] + ': '),
+            steps=[
+                dict(label=frame_name, method='animate', args=[[frame_name], animation_settings])
+                for frame_name in frame_names
+            ]
+        )],
+        margin=dict(b=120)
+    )
+    return fig
+
+
+def get_sweep_figure(sweep_parameter, parameters):
+    with metrics.timed('sweep'):
+        sweep_values, results = compute_sweep(sweep_parameter, parameters)
+    with metrics.timed('sweep_figure'):
+        return make_sweep_figure(sweep_parameter, sweep_values, results)
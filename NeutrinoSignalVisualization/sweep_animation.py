@@ -0,0 +1,128 @@
+from dash.dependencies import Input, Output, State
+import dash_core_components as dcc
+import dash_html_components as html
+import dash.exceptions
+from NuRadioReco.utilities import units
+from app import app
+import sweep
+from request_coalescing import coalescer
+
+layout = html.Div([
+    html.Div([
+        html.Div([
+            html.Div('Parameter Sweep', className='panel-heading'),
+            html.Div([
+                html.Div([
+                    html.Div('Sweep Parameter'),
+                    dcc.Dropdown(
+                        id='sweep-parameter-dropdown',
+                        options=[
+                            {'label': 'Energy', 'value': 'log_energy'},
+                            {'label': 'Viewing Angle', 'value': 'viewing_angle'},
+                            {'label': 'Propagation Length', 'value': 'propagation_length'}
+                        ],
+                        value='viewing_angle',
+                        multi=False,
+                        clearable=False
+                    )
+                ], className='input-group'),
+                html.Div([
+                    html.Button('Compute Sweep', id='sweep-button', n_clicks=0)
+                ], className='input-group')
+            ], className='panel-body')
+        ], className='panel panel-default')
+    ], style={'flex': '1'}),
+    html.Div([
+        html.Div([
+            html.Div('Sweep Animation', className='panel-heading'),
+            html.Div([
+                dcc.Loading(dcc.Graph(id='sweep-plot'))
+            ], className='panel-body')
+        ], className='panel panel-default')
+    ], style={'flex': '4'})
+], style={'display': 'flex'})
+
+
+# The settings of the signal chain, as passed to get_parameters
+parameter_states = [
+    State('energy-slider', 'value'),
+    State('viewing-angle-slider', 'value'),
+    State('shower-type-radio-items', 'value'),
+    State('polarization-angle-slider', 'value'),
+    State('shower-model-dropdown', 'value'),
+    State('propagation-length-slider', 'value'),
+    State('attenuation-model-radio-items', 'value'),
+    State('ice-depth-slider', 'value'),
+    State('depth-profile-checklist', 'value'),
+    State('antenna-type-radio-items', 'value'),
+    State('signal-zenith-slider', 'value'),
+    State('signal-azimuth-slider', 'value'),
+    State('amplifier-type-dropdown', 'value'),
+    State('filter-toggle-checklist', 'value'),
+    State('filter-band-range-slider', 'value'),
+    State('trace-samples-dropdown', 'value'),
+    State('sampling-rate-dropdown', 'value')
+]
+
+
+def get_parameters(
+    log_energy,
+    viewing_angle,
+    shower_type,
+    polarization_angle,
+    models,
+    propagation_length,
+    attenuation_model,
+    depth,
+    depth_profile,
+    antenna_type,
+    signal_zenith,
+    signal_azimuth,
+    amplifier_type,
+    filter_toggle,
+    filter_band,
+    samples,
+    sampling_rate
+):
+    """
+    Returns the parameters (as in batch.default_parameters) for the values of
+    parameter_states, with the first of the selected shower models, or None
+    if no model is selected.
+    """
+    if not models:
+        return None
+    return {
+        'log_energy': log_energy,
+        'viewing_angle': viewing_angle,
+        'shower_type': shower_type,
+        'model': models[0],
+        'propagation_length': propagation_length,
+        'attenuation_model': attenuation_model,
+        'depth': depth,
+        'path_zenith': signal_zenith if 'profile' in depth_profile else None,
+        'polarization_angle': polarization_angle,
+        'antenna_type': antenna_type,
+        'zenith': signal_zenith,
+        'azimuth': signal_azimuth,
+        'amplifier_type': amplifier_type,
+        'filter_band': tuple(filter_band) if 'filter' in filter_toggle else None,
+        'samples': samples,
+        'sampling_rate': sampling_rate * units.GHz
+    }
+
+
+@app.callback(
+    Output('sweep-plot', 'figure'),
+    [Input('sweep-button', 'n_clicks')],
+    [State('sweep-parameter-dropdown', 'value')] + parameter_states
+)
+def update_sweep_plot(n_clicks, sweep_parameter, *parameter_values):
+    """
+    Sweeps the first of the selected shower models.
+    """
+    if not n_clicks:
+        raise dash.exceptions.PreventUpdate()
+    parameters = get_parameters(*parameter_values)
+    if parameters is None:
+        raise dash.exceptions.PreventUpdate()
+    return coalescer.run('sweep', sweep.get_sweep_figure, sweep_parameter, parameters)
@@ -0,0 +1,135 @@
+from dash.dependencies import Input, Output, State
+import dash_core_components as dcc
+import dash_html_components as html
+import dash
+import dash.exceptions
+import json
+from app import app
+import noise
+import sweep_animation
+from request_coalescing import coalescer
+
+layout = html.Div([
+    html.Div([
+        html.Div([
+            html.Div('Trigger Efficiency', className='panel-heading'),
+            html.Div([
+                html.Div([
+                    html.Div('Scan Parameter'),
+                    dcc.Dropdown(
+                        id='trigger-scan-parameter-dropdown',
+                        options=[
+                            {'label': 'Energy', 'value': 'log_energy'},
+                            {'label': 'Viewing Angle', 'value': 'viewing_angle'}
+                        ],
+                        value='log_energy',
+                        multi=False,
+                        clearable=False
+                    )
+                ], className='input-group'),
+                html.Div([
+                    html.Div('Trigger'),
+                    dcc.RadioItems(
+                        id='trigger-type-radio-items',
+                        options=[
+                            {'label': 'Threshold', 'value': 'threshold'},
+                            {'label': 'Power Integration', 'value': 'power'}
+                        ],
+                        value='threshold',
+                        labelStyle={'padding': '0 5px'}
+                    )
+                ], className='input-group'),
+                html.Div([
+                    html.Div('Threshold [noise rms / noise power]'),
+                    dcc.Slider(
+                        id='trigger-threshold-slider',
+                        min=1,
+                        max=10,
+                        step=.5,
+                        value=4,
+                        marks={value: str(value) for value in range(1, 11)}
+                    )
+                ], className='input-group'),
+                html.Div([
+                    html.Div('Noise Realizations'),
+                    dcc.Dropdown(
+                        id='trigger-realizations-dropdown',
+                        options=[
+                            {'label': str(n_realizations), 'value': n_realizations}
+                            for n_realizations in [1000, 5000, 10000, 50000]
+                        ],
+                        value=5000,
+                        multi=False,
+                        clearable=False
+                    )
+                ], className='input-group'),
+                html.Div([
+                    html.Button('Compute Efficiency', id='trigger-button', n_clicks=0)
+                ], className='input-group')
+            ], className='panel-body')
+        ], className='panel panel-default')
+    ], style={'flex': '1'}),
+    html.Div([
+        html.Div([
+            html.Div('Trigger Efficiency', className='panel-heading'),
+            html.Div([
+                dcc.Graph(id='trigger-efficiency-plot')
+            ], className='panel-body')
+        ], className='panel panel-default')
+    ], style={'flex': '4'}),
+    html.Div(id='trigger-efficiency-storage', children=json.dumps(None), style={'display': 'none'}),
+    dcc.Interval(id='trigger-efficiency-interval', interval=1000, disabled=True)
+], style={'display': 'flex'})
+
+
+@app.callback(
+    [Output('trigger-efficiency-plot', 'figure'),
+    Output('trigger-efficiency-storage', 'children'),
+    Output('trigger-efficiency-interval', 'disabled')],
+    [Input('trigger-button', 'n_clicks'),
+    Input('trigger-efficiency-interval', 'n_intervals')],
+    [State('trigger-efficiency-storage', 'children'),
+    State('trigger-scan-parameter-dropdown', 'value'),
+    State('trigger-type-radio-items', 'value'),
+    State('trigger-threshold-slider', 'value'),
+    State('trigger-realizations-dropdown', 'value')] + sweep_animation.parameter_states
+)
+def update_trigger_efficiency_plot(
+    n_clicks,
+    n_intervals,
+    stored_state,
+    scan_parameter,
+    trigger_type,
+    threshold,
+    n_realizations,
+    *parameter_values
+):
+    """
+    The button starts a new scan, after which every tick of the interval adds
+    one batch of noise realizations until all are done. Ticks are not
+    coalesced, since each one continues from the state of the previous one.
+    The scan uses the first of the selected shower models.
+    """
+    if not n_clicks:
+        raise dash.exceptions.PreventUpdate()
+    triggered = [trigger['prop_id'] for trigger in dash.callback_context.triggered]
+    if 'trigger-button.n_clicks' in triggered:
+        parameters = sweep_animation.get_parameters(*parameter_values)
+        if parameters is None:
+            raise dash.exceptions.PreventUpdate()
+        state = {
+            'scan_parameter': scan_parameter,
+            'trigger_type': trigger_type,
+            'threshold': threshold,
+            'n_realizations': n_realizations,
+            'n_done': 0,
+            'counts': [],
+            'parameters': parameters
+        }
+        fig, state = coalescer.run('trigger-efficiency', noise.get_efficiency_update, state)
+    else:
+        state = json.loads(stored_state)
+        if state is None or state['n_done'] >= state['n_realizations']:
+            raise dash.exceptions.PreventUpdate()
+        fig, state = noise.get_efficiency_update(state)
+    return fig, json.dumps(state), state['n_done'] >= state['n_realizations']
@@ -1,20 +1,24 @@
-from dash.dependencies import Input, Output, State
+from dash.dependencies import Input, Output, State, ClientsideFunction
 import dash_core_components as dcc
 import dash_html_components as html
 import dash
-import plotly.subplots
 import plotly.graph_objs as go
 import numpy as np
 import json
-from NuRadioReco.utilities import units, fft
-import NuRadioReco.detector.antennapattern
-import NuRadioReco.detector.ARIANNA.analog_components
-import NuRadioReco.detector.RNO_G.analog_components
-import radiotools.helper as hp
+from NuRadioReco.utilities import units
+import plotly.utils
 from app import app
-import scipy.signal
-
-antennapattern_provider = NuRadioReco.detector.antennapattern.AntennaPatternProvider()
+import signal_chain
+from downsampling import get_common_downsample_indices
+from result_store import result_store
+from request_coalescing import coalescer
+import metrics
+import antenna_response
+import antenna_meshes
+from cache import memoize
+import noise
+import transport
+import export
 
 layout = html.Div([
     html.Div([
@@ -114,6 +118,15 @@ layout = html.Div([
                                 .5: '500MHz'
                             }
                         )
+                    ], className='input-group'),
+                    html.Div([
+                        dcc.Checklist(
+                            id='noise-toggle-checklist',
+                            options=[
+                                {'label': 'Thermal Noise', 'value': 'noise'}
+                            ],
+                            value=[]
+                        )
                     ], className='input-group')
                 ], className='panel-body')
             ], className='panel panel-default')
@@ -122,7 +135,9 @@ layout = html.Div([
             html.Div([
                 html.Div('Voltage', className='panel-heading'),
                 html.Div([
-                    dcc.Graph(id='voltage-plots')
+                    dcc.Graph(id='voltage-plots'),
+                    html.Div(id='voltage-data', children=json.dumps(None), style={'display': 'none'}),
+                    html.Div(id='detector-response-data', children=json.dumps(None), style={'display': 'none'})
                 ], className='panel-body')
             ], className='panel panel-default')
         ],style={'flex': '4'})
@@ -132,7 +147,8 @@ layout = html.Div([
             html.Div([
                 html.Div('Signal Direction', className='panel-heading'),
                 html.Div([
-                dcc.Graph(id='signal-direction-plot')
+                dcc.Graph(id='signal-direction-plot'),
+                html.Div(id='signal-direction-base', children=json.dumps(None), style={'display': 'none'})
                 ], className='panel-body')
             ], className='panel panel-default')
         ], style={'flex': '1'}),
@@ -144,19 +160,67 @@ layout = html.Div([
                 ], className='panel-body')
             ], className='panel panel-default')
         ],style={'flex': '4'})
+    ],style={'display': 'flex'}),
+    html.Div([
+        html.Div([
+            html.Div([
+                html.Div('Sky Map', className='panel-heading'),
+                html.Div([
+                    html.Div([
+                        dcc.RadioItems(
+                            id='sky-map-quantity-radio-items',
+                            options=[
+                                {'label': 'Off', 'value': 'off'},
+                                {'label': 'Effective Length', 'value': 'effective_length'},
+                                {'label': 'Peak Voltage', 'value': 'peak_voltage'}
+                            ],
+                            value='off',
+                            labelStyle={'padding': '0 5px'}
+                        )
+                    ], className='input-group'),
+                    html.Div([
+                        html.Div('Frequency Band (Effective Length)'),
+                        dcc.RangeSlider(
+                            id='sky-map-band-range-slider',
+                            min=0,
+                            max=.5,
+                            step=.01,
+                            value=[.1,.3],
+                            marks={
+                                0: '0MHz',
+                                .1: '100MHz',
+                                .2: '200MHz',
+                                .3: '300MHz',
+                                .4: '400MHz',
+                                .5: '500MHz'
+                            }
+                        )
+                    ], className='input-group')
+                ], className='panel-body')
+            ], className='panel panel-default')
+        ], style={'flex': '1'}),
+        html.Div([
+            html.Div([
+                html.Div('Antenna Sensitivity', className='panel-heading'),
+                html.Div([
+                    dcc.Graph(id='sky-map-plot')
+                ], className='panel-body')
+            ], className='panel panel-default')
+        ],style={'flex': '4'})
     ],style={'display': 'flex'})
 ])
 
 @app.callback(
-    [Output('voltage-plots', 'figure'),
-    Output('detector-response-plot', 'figure')],
+    [Output('voltage-data', 'children'),
+    Output('detector-response-data', 'children')],
     [Input('efield-trace-storage', 'children'),
     Input('antenna-type-radio-items', 'value'),
     Input('signal-zenith-slider', 'value'),
     Input('signal-azimuth-slider', 'value'),
     Input('amplifier-type-dropdown', 'value'),
     Input('filter-toggle-checklist', 'value'),
-    Input('filter-band-range-slider', 'value')]
+    Input('filter-band-range-slider', 'value'),
+    Input('noise-toggle-checklist', 'value')]
 )
 def update_voltage_plot(
     electric_field,
@@ -165,161 +229,199 @@ def update_voltage_plot(
     signal_azimuth,
     amplifier_type,
     filter_toggle,
-    filter_band
+    filter_band,
+    noise_toggle
 ):
-    samples = 512
-    sampling_rate = 1.*units.GHz
-    electric_field = json.loads(electric_field)
-    if electric_field is None:
-        return {}, {}
-    antenna_pattern = antennapattern_provider.load_antenna_pattern(antenna_type)
-    freqs = np.fft.rfftfreq(samples, 1./sampling_rate)
-    times = np.arange(samples) / sampling_rate
-    signal_zenith = signal_zenith * units.deg
-    signal_azimuth = signal_azimuth * units.deg
-
-    antenna_response =antenna_pattern.get_antenna_response_vectorized(
-        freqs,
+    return coalescer.run(
+        'voltage',
+        build_voltage_plot,
+        electric_field,
+        antenna_type,
         signal_zenith,
         signal_azimuth,
-        0.,
-        0.,
-        90.*units.deg,
-        0.
+        amplifier_type,
+        filter_toggle,
+        filter_band,
+        noise_toggle
     )
-    detector_response_theta = antenna_response['theta']
-    detector_response_phi = antenna_response['phi']
-    channel_spectrum = antenna_response['theta'] * fft.time2freq(electric_field['theta'], sampling_rate) + antenna_response['phi'] * fft.time2freq(electric_field['phi'], sampling_rate)
-    if amplifier_type is not None:
-        if amplifier_type == 'iglu' or amplifier_type == 'rno_surface':
-            amp_response = NuRadioReco.detector.RNO_G.analog_components.load_amp_response(amplifier_type)
-            amplifier_response = amp_response['gain'](freqs) * np.exp(1j * amp_response['phase'](freqs))
-        else:
-            amp_response = NuRadioReco.detector.ARIANNA.analog_components.load_amplifier_response(amplifier_type)
-            amplifier_response = amp_response['gain'](freqs) * amp_response['phase'](freqs)
-        channel_spectrum = channel_spectrum * amplifier_response
-        detector_response_theta *= amplifier_response
-        detector_response_phi *= amplifier_response
+
+
+def build_voltage_plot(
+    electric_field,
+    antenna_type,
+    signal_zenith,
+    signal_azimuth,
+    amplifier_type,
+    filter_toggle,
+    filter_band,
+    noise_toggle
+):
+    """
+    Returns the voltage plot data for the electric field of each model in
+    the storage, with the noise added to the first one. The voltage of a
+    loaded snapshot is used if the storage refers to it and the detector
+    settings are those of the snapshot.
+    """
+    efield_reference = json.loads(electric_field)
+    if efield_reference is None:
+        return json.dumps(None), json.dumps(None)
     if 'filter' in filter_toggle:
-        mask = freqs > 0
-        b, a = scipy.signal.butter(10, filter_band, 'bandpass', analog=True)
-        w, h = scipy.signal.freqs(b, a, freqs[mask])
-        channel_spectrum[mask] = channel_spectrum[mask] * np.abs(h)
-        detector_response_theta[mask] *= np.abs(h)
-        detector_response_phi[mask] *= np.abs(h)
-    channel_trace = fft.freq2time(channel_spectrum, sampling_rate)
-    fig = plotly.subplots.make_subplots(rows=1, cols=2,
-        shared_xaxes=False, shared_yaxes=False,
-        vertical_spacing=0.01, subplot_titles=['Time Trace', 'Spectrum'])
-    fig.append_trace(go.Scatter(
-        x=times/units.ns,
-        y=channel_trace/units.mV,
-        name='U (t)'
-    ),1,1)
-    fig.append_trace(go.Scatter(
-        x=freqs/units.MHz,
-        y=np.abs(channel_spectrum)/(units.mV/units.GHz),
-        name='U (f)'
-    ), 1, 2)
-    fig.update_xaxes(title_text='t [ns]', row=1, col=1)
-    fig.update_xaxes(title_text='f [MHz]', row=1, col=2)
-    fig.update_yaxes(title_text='U [mV]', row=1, col=1)
-    fig.update_yaxes(title_text='U [mV/GHz]', row=1, col=2)
+        filter_band = tuple(filter_band)
+    else:
+        filter_band = None
+    samples, sampling_rate = efield_reference['parameters'][-2:]
+    with metrics.timed('detector_response'):
+        detector_response_theta, detector_response_phi = signal_chain.get_detector_response(
+            antenna_type,
+            signal_zenith,
+            signal_azimuth,
+            amplifier_type,
+            filter_band,
+            samples,
+            sampling_rate
+        )
+    coalescer.check_cancelled()
+    noise_trace = None
+    if 'noise' in noise_toggle:
+        with metrics.timed('noise'):
+            noise_trace = noise.get_noise_trace(amplifier_type, filter_band, samples, sampling_rate)
+    model_data = []
+    for reference in efield_reference.get('models', [dict(efield_reference, model=None)]):
+        efield = result_store.get(reference['key'])
+        if efield is None:
+            efield = signal_chain.get_efield(reference['parameters'])
+            coalescer.check_cancelled()
+        voltage_parameters = [reference['parameters'], antenna_type, signal_zenith, signal_azimuth, amplifier_type, filter_band]
+        voltage = export.get_snapshot_voltage(reference, voltage_parameters)
+        if voltage is None:
+            voltage = result_store.get(result_store.make_key('voltage', voltage_parameters))
+        if voltage is None:
+            with metrics.timed('channel_voltage'):
+                channel_spectra, channel_traces = signal_chain.get_channel_voltage_components(
+                    efield['spectrum'],
+                    antenna_type,
+                    signal_zenith,
+                    signal_azimuth,
+                    amplifier_type,
+                    filter_band,
+                    samples,
+                    sampling_rate
+                )
+            voltage = {'spectra': channel_spectra, 'traces': channel_traces}
+            result_store.put('voltage', voltage_parameters, voltage)
+        with metrics.timed('voltage_figure'):
+            model_data.append(dict(
+                make_voltage_data(voltage['spectra'], voltage['traces'], samples, sampling_rate, noise_trace if len(model_data) == 0 else None),
+                model=reference['model']
+            ))
+    with metrics.timed('voltage_figure'):
+        detector_response_data = make_detector_response_data(
+            detector_response_theta,
+            detector_response_phi,
+            samples,
+            sampling_rate
+        )
+    return transport.dumps({'models': model_data}), transport.dumps(detector_response_data)
 
-    fig2 = plotly.subplots.make_subplots(rows=1, cols=2,
-        shared_xaxes=False, shared_yaxes=True,
-        vertical_spacing=0.01, subplot_titles=['Theta', 'Phi'])
-    fig2.append_trace(go.Scatter(
-        x=freqs/units.MHz,
-        y=np.abs(detector_response_theta),
-        name='Theta'
-    ),1,1)
-    fig2.append_trace(go.Scatter(
-        x=freqs/units.MHz,
-        y=np.abs(detector_response_phi),
-        name='Phi'
-    ),1,2)
-    fig2.update_xaxes(title_text='f [MHz]', row=1, col=1)
-    fig2.update_xaxes(title_text='f [MHz]', row=1, col=2)
-    fig2.update_yaxes(title_text='VEL', row=1, col=1)
-    fig2.update_yaxes(title_text='VEL', row=1, col=2)
 
-    return [fig, fig2]
+def make_voltage_data(channel_spectra, channel_traces, samples, sampling_rate, noise_trace=None):
+    """
+    Returns the arrays of the voltage plot for the theta and phi components,
+    which the browser combines for the polarization angle. Both components
+    are downsampled at the same samples.
+    """
+    freqs = signal_chain.get_frequencies(samples, sampling_rate)
+    times = signal_chain.get_times(samples, sampling_rate)
+    traces = list(channel_traces)
+    if noise_trace is not None:
+        traces.append(noise_trace)
+    trace_indices = get_common_downsample_indices(traces)
+    spectrum_indices = get_common_downsample_indices(np.abs(channel_spectra))
+    return {
+        'times': times[trace_indices],
+        'traces': channel_traces[:, trace_indices],
+        'noise': None if noise_trace is None else noise_trace[trace_indices],
+        'freqs': freqs[spectrum_indices],
+        'spectra_real': channel_spectra[:, spectrum_indices].real,
+        'spectra_imag': channel_spectra[:, spectrum_indices].imag,
+        'units': {
+            'time': units.ns,
+            'frequency': units.MHz,
+            'trace': units.mV,
+            'spectrum': units.mV / units.GHz
+        }
+    }
 
-@app.callback(
-    Output('signal-direction-plot', 'figure'),
-    [Input('signal-zenith-slider', 'value'),
-    Input('signal-azimuth-slider', 'value'),
-    Input('antenna-type-radio-items', 'value')]
+
+def make_detector_response_data(detector_response_theta, detector_response_phi, samples, sampling_rate):
+    freqs = signal_chain.get_frequencies(samples, sampling_rate)
+    responses = np.abs([detector_response_theta, detector_response_phi])
+    indices = get_common_downsample_indices(responses)
+    return {
+        'freqs': freqs[indices],
+        'theta': responses[0, indices],
+        'phi': responses[1, indices],
+        'units': {
+            'frequency': units.MHz
+        }
+    }
+
+
+app.clientside_callback(
+    ClientsideFunction(namespace='signal_chain', function_name='voltage_figure'),
+    Output('voltage-plots', 'figure'),
+    [Input('voltage-data', 'children'),
+    Input('polarization-angle-slider', 'value')]
 )
-def update_signal_direction_plot(zenith, azimuth, antenna_type):
-    zenith = zenith * units.deg
-    azimuth = azimuth * units.deg
-    signal_direction = hp.spherical_to_cartesian(zenith, azimuth)
-    data = []
-    data.append(go.Scatter3d(
-        x=[0,signal_direction[0]],
-        y=[0,signal_direction[1]],
-        z=[0,signal_direction[2]],
-        mode='lines',
-        name='Signal Direction'
-    ))
-    data.append(go.Scatter3d(
-        x=[0,0],
-        y=[0,0],
-        z=[0,1],
-        mode='lines',
-        name='Antenna Orientation'
-    ))
-    data.append(go.Scatter3d(
-        x=[0,0],
-        y=[0,1],
-        z=[0,0],
-        mode='lines',
-        name='Antenna Rotation'
-    ))
-    if antenna_type == 'createLPDA_100MHz_InfFirn':
-        data.append(go.Mesh3d(
-            x = [0,0,0],
-            y = [-.25,0,.25],
-            z = [0,.75,0],
-            delaunayaxis='x',
-            opacity=.5,
-            color='black'
-            ))
-    else:
-        d_angle = 30
-        angles = np.arange(0, 360, d_angle) *units.deg
-        r = .05
-        cylinder_points = []
-        i = []
-        j = []
-        k = []
-        for i_angle, angle in enumerate(angles):
-            cylinder_points.append([r*np.cos(angle), r*np.sin(angle), -.5])
-            cylinder_points.append([r*np.cos(angle), r*np.sin(angle), .5])
-            cylinder_points.append([r*np.cos(angle+d_angle*units.deg), r*np.sin(angle+d_angle*units.deg), -.5])
-            cylinder_points.append([r*np.cos(angle), r*np.sin(angle), .5])
-            cylinder_points.append([r*np.cos(angle+d_angle*units.deg), r*np.sin(angle+d_angle*units.deg), -.5])
-            cylinder_points.append([r*np.cos(angle+d_angle*units.deg), r*np.sin(angle+d_angle*units.deg), .5])
-            i.append(6 * i_angle)
-            j.append(6 * i_angle+1)
-            k.append(6 * i_angle+2)
-            i.append(6 * i_angle+3)
-            j.append(6 * i_angle+4)
-            k.append(6 * i_angle+5)
-        cylinder_points = np.array(cylinder_points)
+
+app.clientside_callback(
+    ClientsideFunction(namespace='signal_chain', function_name='detector_response_figure'),
+    Output('detector-response-plot', 'figure'),
+    [Input('detector-response-data', 'children')]
+)
+
+@memoize(max_size=8)
+def get_signal_direction_base_figure(antenna_type):
+    """
+    Returns the JSON of the signal direction figure without the signal
+    direction, whose trace (the first one) is filled in by the browser.
+    """
+    data = [
+        go.Scatter3d(
+            x=[0,0],
+            y=[0,0],
+            z=[0,0],
+            mode='lines',
+            name='Signal Direction'
+        ),
+        go.Scatter3d(
+            x=[0,0],
+            y=[0,0],
+            z=[0,1],
+            mode='lines',
+            name='Antenna Orientation'
+        ),
+        go.Scatter3d(
+            x=[0,0],
+            y=[0,1],
+            z=[0,0],
+            mode='lines',
+            name='Antenna Rotation'
+        )
+    ]
+    if antenna_type in antenna_meshes.antenna_meshes:
+        vertices, faces = antenna_meshes.antenna_meshes[antenna_type]
         data.append(go.Mesh3d(
-            x = cylinder_points[:,0],
-            y = cylinder_points[:,1],
-            z = cylinder_points[:,2],
-            i = i,
-            j = j,
-            k = k,
+            x=vertices[:, 0],
+            y=vertices[:, 1],
+            z=vertices[:, 2],
+            i=faces[:, 0],
+            j=faces[:, 1],
+            k=faces[:, 2],
             color='black',
-            opacity=.5
+            opacity=.5,
+            name='Antenna'
         ))
-
     fig = go.Figure(
         data=data
     )
@@ -338,6 +440,101 @@ def update_signal_direction_plot(zenith, azimuth, antenna_type):
             r=10,
             t=10,
             b=10
-        )
+        ),
+        uirevision='signal-direction'
     )
+    return json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
+
+
+metrics.register_cache('get_signal_direction_base_figure', get_signal_direction_base_figure.cache)
+
+
+@app.callback(
+    Output('signal-direction-base', 'children'),
+    [Input('antenna-type-radio-items', 'value')]
+)
+def update_signal_direction_base(antenna_type):
+    with metrics.timed('direction_figure'):
+        return get_signal_direction_base_figure(antenna_type)
+
+
+app.clientside_callback(
+    ClientsideFunction(namespace='signal_chain', function_name='signal_direction_figure'),
+    Output('signal-direction-plot', 'figure'),
+    [Input('signal-zenith-slider', 'value'),
+    Input('signal-azimuth-slider', 'value'),
+    Input('signal-direction-base', 'children')]
+)
+
+
+@app.callback(
+    Output('sky-map-plot', 'figure'),
+    [Input('sky-map-quantity-radio-items', 'value'),
+    Input('sky-map-band-range-slider', 'value'),
+    Input('efield-trace-storage', 'children'),
+    Input('antenna-type-radio-items', 'value'),
+    Input('signal-zenith-slider', 'value'),
+    Input('signal-azimuth-slider', 'value'),
+    Input('amplifier-type-dropdown', 'value'),
+    Input('filter-toggle-checklist', 'value'),
+    Input('filter-band-range-slider', 'value'),
+    Input('polarization-angle-slider', 'value')]
+)
+def update_sky_map_plot(
+    quantity,
+    band,
+    electric_field,
+    antenna_type,
+    signal_zenith,
+    signal_azimuth,
+    amplifier_type,
+    filter_toggle,
+    filter_band,
+    polarization_angle
+):
+    if quantity == 'off':
+        return {}
+    if 'filter' in filter_toggle:
+        filter_band = tuple(filter_band)
+    else:
+        filter_band = None
+    efield_reference = json.loads(electric_field)
+    if quantity == 'effective_length':
+        if efield_reference is None:
+            samples, sampling_rate = signal_chain.default_samples, signal_chain.default_sampling_rate
+        else:
+            samples, sampling_rate = efield_reference['parameters'][-2:]
+        with metrics.timed('sky_map'):
+            sky_map = signal_chain.get_effective_length_map(antenna_type, amplifier_type, filter_band, tuple(band), samples, sampling_rate)
+        colorbar_title = 'VEL'
+    else:
+        if efield_reference is None:
+            return {}
+        with metrics.timed('sky_map'):
+            sky_map = signal_chain.get_peak_voltage_map(
+                tuple(efield_reference['parameters']),
+                polarization_angle,
+                antenna_type,
+                amplifier_type,
+                filter_band
+            )
+        sky_map = sky_map / units.mV
+        colorbar_title = 'U [mV]'
+    fig = go.Figure(data=[
+        go.Heatmap(
+            x=antenna_response.azimuth_grid,
+            y=antenna_response.zenith_grid,
+            z=sky_map,
+            colorbar=dict(title=colorbar_title)
+        ),
+        go.Scatter(
+            x=[signal_azimuth],
+            y=[signal_zenith],
+            mode='markers',
+            marker=dict(color='white', size=10, line=dict(color='black', width=1)),
+            name='Signal Direction'
+        )
+    ])
+    fig.update_xaxes(title_text='azimuth [deg]')
+    fig.update_yaxes(title_text='zenith [deg]', autorange='reversed')
     return fig
@@ -0,0 +1,17 @@
+"""
+WSGI entry point for running the app with a production server, e.g.
+
+    gunicorn --workers 4 --threads 4 --bind 0.0.0.0:8080 wsgi:server
+
+All workers share the on-disk cache of spectra and antenna responses in
+NSV_CACHE_DIR, so a result computed by one worker is served by all of them.
+Each worker warms up its antenna patterns in a background thread, so the app
+should not be preloaded before forking. /ready reports when warm-up is done.
+"""
+import index
+import startup
+from app import server
+
+startup.start_warm_up()
+
+application = server